@@ -0,0 +1,135 @@
+"""Local stand-in for the Telegram Bot API used by the load test.
+
+Implements just enough of the HTTP interface for aiogram and aiogram_dialog:
+message sending/editing returns well-formed ``Message`` objects, inline
+keyboards are remembered per chat so scripted users can press buttons, and
+``getFile`` plus the file endpoint serve photos registered with ``add_file``.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+BOT_ID = 42
+BOT_USERNAME = "mtlfest_bench_bot"
+
+_MESSAGE_METHODS = {
+    "sendmessage",
+    "sendphoto",
+    "senddocument",
+    "editmessagetext",
+    "editmessagecaption",
+    "editmessagemedia",
+    "editmessagereplymarkup",
+}
+
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.last_messages: Dict[int, Dict[str, Any]] = {}
+        self._files: Dict[str, bytes] = {}
+        self._message_ids = itertools.count(1000)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def add_file(self, file_id: str, content: bytes):
+        self._files[file_id] = content
+
+    def button(self, chat_id: int, widget_id: str) -> str:
+        """Return the callback data of the ``widget_id`` button in the last bot message."""
+        markup = (self.last_messages.get(chat_id) or {}).get("reply_markup") or {}
+        for row in markup.get("inline_keyboard", []):
+            for button in row:
+                data = button.get("callback_data") or ""
+                # aiogram_dialog prefixes the intent id; item widgets append ":<item>"
+                own = data.split("\x1d", 1)[-1]
+                if own == widget_id or own.startswith(widget_id + ":"):
+                    return data
+        raise LookupError(f"no button {widget_id!r} in chat {chat_id}")
+
+    async def start(self):
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self._handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._handle_file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": self._result(method.lower(), params)})
+
+    async def _handle_file(self, request: web.Request) -> web.Response:
+        content = self._files.get(request.match_info["path"])
+        if content is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=content)
+
+    def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == "getme":
+            return {"id": BOT_ID, "is_bot": True, "first_name": "Bench", "username": BOT_USERNAME}
+        if method == "getfile":
+            file_id = params["file_id"]
+            return {"file_id": file_id, "file_unique_id": file_id, "file_path": file_id}
+        if method == "copymessage":
+            return {"message_id": next(self._message_ids)}
+        if method in _MESSAGE_METHODS:
+            return self._message(method, params)
+        return True
+
+    def _message(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(params["chat_id"])
+        previous = self.last_messages.get(chat_id)
+        is_edit = method.startswith("edit")
+        if is_edit and previous and str(previous["message_id"]) == str(params.get("message_id")):
+            message = dict(previous)
+        elif is_edit:
+            # Editing an older message: answer it, but keep tracking the latest one.
+            message = {"message_id": int(params["message_id"]), "chat": {"id": chat_id, "type": "private"}}
+        else:
+            message = {"message_id": next(self._message_ids), "chat": {"id": chat_id, "type": "private"}}
+        message["date"] = int(time.time())
+
+        if "text" in params:
+            message["text"] = params["text"]
+            message.pop("photo", None)
+        if "caption" in params:
+            message["caption"] = params["caption"]
+        if method in ("sendphoto", "editmessagemedia"):
+            file_id = f"photo-{message['message_id']}"
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 400, "height": 400}]
+            message.pop("text", None)
+        if method == "senddocument":
+            file_id = f"document-{message['message_id']}"
+            message["document"] = {"file_id": file_id, "file_unique_id": file_id}
+
+        markup = params.get("reply_markup")
+        message["reply_markup"] = json.loads(markup) if isinstance(markup, str) else markup
+        if not message["reply_markup"]:
+            message.pop("reply_markup")
+
+        if not previous or message["message_id"] >= previous["message_id"]:
+            self.last_messages[chat_id] = message
+        return message
@@ -0,0 +1,359 @@
+"""End-to-end load test for the bot.
+
+Runs the real dispatcher from ``main.create_dispatcher`` against ``FakeBotAPI``
+and in-memory (or local) Mongo and Redis, drives scripted users through the
+registration dialog and admins through QR scanning, and reports throughput,
+latency percentiles and Mongo operations per update for every step.
+
+Usage::
+
+    python -m bench.load_test --users 1000 --concurrency 200 --admins 3
+    python -m bench.load_test --mongo mongodb://localhost:27017 --redis redis://localhost:6379/15
+
+The in-memory Mongo stand-in needs ``mongomock-motor`` (``pip install mongomock-motor``);
+it is not part of the bot's runtime requirements.
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# Config refuses to import without these; the token only ever reaches FakeBotAPI.
+os.environ.setdefault("TEST_BOT_TOKEN", "42:bench-token")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+_BENCH_IMAGE_DIR = tempfile.mkdtemp(prefix="mtlfest_bench_images_")
+os.environ.setdefault("IMAGE_CACHE_DIR", _BENCH_IMAGE_DIR)
+os.environ.setdefault("HEALTH_PORT", "0")
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.default import DefaultBotProperties  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.fsm.storage.base import DefaultKeyBuilder  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+from loguru import logger  # noqa: E402
+
+from bench.fake_bot_api import FakeBotAPI  # noqa: E402
+from config.bot_config import config  # noqa: E402
+from database import database  # noqa: E402
+from database.connection import attach_database  # noqa: E402
+from services.telegram_api import create_session  # noqa: E402
+
+BENCH_DB_NAME = "FEST_bench"
+
+_COUNTED_METHODS = {
+    "aggregate", "bulk_write", "count_documents", "create_index", "delete_many", "delete_one",
+    "distinct", "find", "find_one", "find_one_and_update", "insert_many", "insert_one",
+    "replace_one", "update_many", "update_one",
+}
+
+# [mongo operations, image store lookups] made on behalf of the current step
+_current_ops: ContextVar[Optional[List[int]]] = ContextVar("bench_ops", default=None)
+
+# Steps that must not touch Mongo or the image store: (db ops, disk ops) allowed per update.
+IO_BUDGET = {"browse": (0, 0)}
+
+
+class _CountingCollection:
+    """Collection proxy that counts driver calls made on behalf of the current step."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in _COUNTED_METHODS:
+            return attr
+
+        def counted(*args, **kwargs):
+            ops = _current_ops.get()
+            if ops is not None:
+                ops[0] += 1
+            return attr(*args, **kwargs)
+
+        return counted
+
+
+class _CountingDatabase:
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        return _CountingCollection(getattr(self._db, name))
+
+    def __getitem__(self, name):
+        return _CountingCollection(self._db[name])
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.api = FakeBotAPI(latency=args.api_latency / 1000)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.db_ops: Dict[str, int] = defaultdict(int)
+        self.disk_ops: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.tickets: asyncio.Queue = asyncio.Queue()
+        self._update_ids = itertools.count(1)
+        self._query_ids = itertools.count(1)
+        self._tmp = tempfile.TemporaryDirectory(prefix="mtlfest_bench_")
+        self.bot: Optional[Bot] = None
+        self.dp = None
+        self.report_text = ""
+
+    async def setup(self):
+        await self.api.start()
+        session = create_session(api=TelegramAPIServer.from_base(self.api.base_url))
+        self.bot = Bot(token=config.BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode='HTML'))
+        config.bot = self.bot
+
+        if self.args.mongo == "memory":
+            from mongomock_motor import AsyncMongoMockClient
+            mongo_db = AsyncMongoMockClient()[BENCH_DB_NAME]
+        else:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            mongo_db = AsyncIOMotorClient(self.args.mongo)[BENCH_DB_NAME]
+            await mongo_db.client.drop_database(BENCH_DB_NAME)
+        attach_database(_CountingDatabase(mongo_db))
+
+        admin_ids = [self.admin_id(n) for n in range(self.args.admins)]
+        await mongo_db.config.update_one({"Key": "Admins"}, {"$set": {"Value": admin_ids}}, upsert=True)
+
+        if self.args.redis == "memory":
+            storage = MemoryStorage()
+        else:
+            from aiogram.fsm.storage.redis import RedisStorage
+            storage = RedisStorage.from_url(url=self.args.redis,
+                                            key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True))
+            await storage.redis.flushdb()
+
+        from database.blob_store import image_store
+        ensure = image_store.ensure
+
+        async def counted_ensure(*args, **kwargs):
+            ops = _current_ops.get()
+            if ops is not None:
+                ops[1] += 1
+            return await ensure(*args, **kwargs)
+
+        image_store.ensure = counted_ensure
+
+        from main import create_dispatcher
+        self.dp = create_dispatcher(storage)
+        await self.dp.emit_startup(bot=self.bot, bots=[self.bot], dispatcher=self.dp)
+
+    async def teardown(self):
+        await self.dp.emit_shutdown(bot=self.bot, bots=[self.bot], dispatcher=self.dp)
+        await self.dp.storage.close()
+        await self.bot.session.close()
+        await self.api.stop()
+        self._tmp.cleanup()
+        shutil.rmtree(_BENCH_IMAGE_DIR, ignore_errors=True)
+
+    @staticmethod
+    def user_id(n: int) -> int:
+        return 1_000_000 + n
+
+    @staticmethod
+    def admin_id(n: int) -> int:
+        return 9_000_000 + n
+
+    def _user(self, user_id: int) -> Dict[str, Any]:
+        return {"id": user_id, "is_bot": False, "first_name": f"u{user_id}", "language_code": self.args.lang}
+
+    def message(self, user_id: int, text: str = None, photo: str = None) -> Update:
+        message = {
+            "message_id": next(self._update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+        }
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        if photo is not None:
+            message["photo"] = [
+                {"file_id": f"{photo}-s", "file_unique_id": f"{photo}-s", "width": 320, "height": 320},
+                {"file_id": photo, "file_unique_id": photo, "width": 1280, "height": 1280},
+            ]
+        return Update.model_validate({"update_id": next(self._update_ids), "message": message},
+                                     context={"bot": self.bot})
+
+    def callback(self, user_id: int, widget_id: str) -> Update:
+        return Update.model_validate({
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._query_ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": self.api.button(user_id, widget_id),
+                "message": self.api.last_messages[user_id],
+            },
+        }, context={"bot": self.bot})
+
+    async def step(self, name: str, update: Update):
+        ops = [0, 0]
+        token = _current_ops.set(ops)
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as exc:
+            self.errors[name] += 1
+            logger.opt(exception=exc).debug("bench step {} failed", name)
+        finally:
+            self.latencies[name].append(time.perf_counter() - started)
+            self.db_ops[name] += ops[0]
+            self.disk_ops[name] += ops[1]
+            _current_ops.reset(token)
+
+    async def run_user(self, n: int):
+        user_id = self.user_id(n)
+        try:
+            await self.step("start", self.message(user_id, "/start"))
+            for widget_id in ("donate", "calendar", "support"):
+                await self.step("browse", self.callback(user_id, widget_id))
+            await self.step("ticket", self.callback(user_id, "ticket_start"))
+            await self.step("ticket", self.callback(user_id, "ticket_country"))
+            await self.step("country", self.message(user_id, "Montenegro"))
+            await self.step("source", self.message(user_id, "Telegram channel"))
+            await self.step("dates", self.callback(user_id, "date_27_11"))
+            await self.step("confirmation", self.callback(user_id, "confirm_dates"))
+        except LookupError as exc:
+            # The expected button was not rendered: the previous step misbehaved.
+            self.errors["flow"] += 1
+            logger.debug("bench user {} aborted: {}", user_id, exc)
+            return
+        profile = await database.get_user_profile(user_id)
+        if profile and profile.ticket_uuid:
+            await self.tickets.put(profile.ticket_uuid)
+
+    async def run_admin(self, n: int, qr_factory):
+        admin_id = self.admin_id(n)
+        await self.step("admin_start", self.message(admin_id, "/start"))
+        await self.step("admin_start", self.callback(admin_id, "scan_qr"))
+        while True:
+            ticket_uuid = await self.tickets.get()
+            if ticket_uuid is None:
+                return
+            file_id = f"scan-{ticket_uuid}"
+            self.api.add_file(file_id, await qr_factory(ticket_uuid))
+            self.api.add_file(f"{file_id}-s", await qr_factory(ticket_uuid))
+            await self.step("scan", self.message(admin_id, photo=file_id))
+
+    async def make_qr(self, ticket_uuid: str) -> bytes:
+        from database.qr_helpers import create_beautiful_code
+        path = os.path.join(self._tmp.name, f"{ticket_uuid}.png")
+        await asyncio.to_thread(create_beautiful_code, path, ticket_uuid, "MTLFEST000")
+        with open(path, "rb") as file:
+            return file.read()
+
+    async def run(self) -> float:
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def limited(n):
+            async with semaphore:
+                await self.run_user(n)
+
+        started = time.perf_counter()
+        admins = [asyncio.create_task(self.run_admin(n, self.make_qr)) for n in range(self.args.admins)]
+        await asyncio.gather(*(limited(n) for n in range(self.args.users)))
+        for _ in admins:
+            await self.tickets.put(None)
+        await asyncio.gather(*admins)
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float) -> str:
+        total = sum(len(values) for values in self.latencies.values())
+        lines = [
+            f"users={self.args.users} admins={self.args.admins} concurrency={self.args.concurrency} "
+            f"mongo={self.args.mongo} redis={self.args.redis}",
+            f"updates: {total} in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.1f} updates/s)",
+            f"{'step':<14}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'db ops/upd':>12}"
+            f"{'disk/upd':>10}{'errors':>8}",
+        ]
+        for name, values in self.latencies.items():
+            lines.append(
+                f"{name:<14}{len(values):>8}"
+                f"{_percentile(values, 50) * 1000:>10.1f}"
+                f"{_percentile(values, 95) * 1000:>10.1f}"
+                f"{_percentile(values, 99) * 1000:>10.1f}"
+                f"{self.db_ops[name] / len(values):>12.2f}"
+                f"{self.disk_ops[name] / len(values):>10.2f}"
+                f"{self.errors.get(name, 0):>8}"
+            )
+        if self.errors.get("flow"):
+            lines.append(f"aborted user flows: {self.errors['flow']}")
+        for violation in self.budget_violations():
+            lines.append(f"I/O budget exceeded: {violation}")
+        api_calls = ", ".join(f"{method}={count}" for method, count in self.api.calls.most_common())
+        lines.append(f"bot api calls: {api_calls}")
+        return "\n".join(lines)
+
+
+    def budget_violations(self) -> List[str]:
+        violations = []
+        for name, (db_budget, disk_budget) in IO_BUDGET.items():
+            count = len(self.latencies.get(name, ()))
+            if not count:
+                continue
+            db_ops, disk_ops = self.db_ops[name] / count, self.disk_ops[name] / count
+            if db_ops > db_budget or disk_ops > disk_budget:
+                violations.append(f"{name}: {db_ops:.2f} db ops, {disk_ops:.2f} disk ops per update "
+                                  f"(allowed {db_budget}, {disk_budget})")
+        return violations
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test the mtlfest bot dispatcher.")
+    parser.add_argument("--users", type=int, default=200, help="scripted users registering a ticket")
+    parser.add_argument("--admins", type=int, default=2, help="admins scanning issued tickets")
+    parser.add_argument("--concurrency", type=int, default=100, help="users in flight at once")
+    parser.add_argument("--lang", default="en", help="language_code of the simulated users")
+    parser.add_argument("--mongo", default="memory", help="'memory' or a MongoDB URI (uses the FEST_bench db)")
+    parser.add_argument("--redis", default="memory", help="'memory' or a Redis URL (the db is flushed)")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="fake Bot API latency, ms")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's INFO logging")
+    return parser.parse_args(argv)
+
+
+async def amain(argv=None) -> LoadTest:
+    args = parse_args(argv)
+    if not args.verbose:
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+    test = LoadTest(args)
+    await test.setup()
+    try:
+        elapsed = await test.run()
+    finally:
+        await test.teardown()
+    test.report_text = test.report(elapsed)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(test.report_text + "\n")
+    return test
+
+
+if __name__ == '__main__':
+    finished = asyncio.run(amain())
+    print(finished.report_text)
+    # static windows reading Mongo or the disk again is a regression
+    sys.exit(1 if finished.budget_violations() else 0)
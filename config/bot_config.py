@@ -1,5 +1,8 @@
 import asyncio
+import json
 import os
+from contextvars import ContextVar
+from typing import Awaitable, Dict, List, Optional
 
 from aiogram import Bot
 from dotenv import load_dotenv
@@ -22,17 +25,230 @@ class Config:
     if not MONGO_URI:
         raise ValueError("Не задан URI для MongoDB. Убедитесь, что в файле .env есть переменная MONGO_URI.")
 
+    MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "FEST")
+    # Driver pool, timeouts and wire compression (zstd/snappy need their python packages installed)
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "2"))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+    MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zlib")
+    MONGO_RETRY_ATTEMPTS = int(os.getenv("MONGO_RETRY_ATTEMPTS", "3"))
+
     SENTRY_DSN = os.getenv("SENTRY_DSN")
 
+    # Logging (config/logging_setup.py): JSON lines in LOG_FILE, rotated and compressed;
+    # LOG_LEVELS overrides single modules, e.g. "database.qr_helpers=WARNING,routers=DEBUG"
+    LOG_FILE = os.getenv("LOG_FILE", "mtlfest_bot.log")
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "database.qr_helpers=WARNING")
+    LOG_STDERR_LEVEL = os.getenv("LOG_STDERR_LEVEL", "INFO")
+    LOG_SERIALIZE = os.getenv("LOG_SERIALIZE", "1") == "1"
+    LOG_ROTATION = os.getenv("LOG_ROTATION", "20 MB")
+    LOG_RETENTION = os.getenv("LOG_RETENTION", "30 days")
+    LOG_COMPRESSION = os.getenv("LOG_COMPRESSION", "gz")
+
+    # Bot API client (services/telegram_api.py): connection pool, keep-alive and request timeout
+    # in seconds; 429s and transient errors are retried API_RETRY_ATTEMPTS times in total,
+    # flood waits longer than API_RETRY_MAX_WAIT seconds are not
+    API_POOL_LIMIT = int(os.getenv("API_POOL_LIMIT", "100"))
+    API_POOL_LIMIT_PER_HOST = int(os.getenv("API_POOL_LIMIT_PER_HOST", "64"))
+    API_KEEPALIVE_TIMEOUT = float(os.getenv("API_KEEPALIVE_TIMEOUT", "60"))
+    API_TIMEOUT = float(os.getenv("API_TIMEOUT", "30"))
+    API_RETRY_ATTEMPTS = int(os.getenv("API_RETRY_ATTEMPTS", "3"))
+    API_RETRY_BACKOFF = float(os.getenv("API_RETRY_BACKOFF", "0.5"))
+    API_RETRY_MAX_WAIT = float(os.getenv("API_RETRY_MAX_WAIT", "30"))
+
     # Другие настройки
     REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/1")
+    # Expiry of FSM/dialog records in seconds, refreshed on every write; 0 keeps them forever
+    FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(30 * 24 * 3600)))
+    FSM_DATA_TTL = int(os.getenv("FSM_DATA_TTL", str(30 * 24 * 3600)))
+    DIALOG_STACK_TTL = int(os.getenv("DIALOG_STACK_TTL", str(7 * 24 * 3600)))
+    DIALOG_CONTEXT_TTL = int(os.getenv("DIALOG_CONTEXT_TTL", str(7 * 24 * 3600)))
+    FSM_SERIALIZER = os.getenv("FSM_SERIALIZER", "msgpack")  # 'msgpack' | 'json'
+
+    # Anti-flood: identical callbacks/commands within the window are dropped,
+    # more than THROTTLE_RATE_LIMIT updates per THROTTLE_RATE_PERIOD seconds are shed
+    THROTTLE_DUPLICATE_WINDOW = float(os.getenv("THROTTLE_DUPLICATE_WINDOW", "1.0"))
+    THROTTLE_RATE_LIMIT = int(os.getenv("THROTTLE_RATE_LIMIT", "12"))
+    THROTTLE_RATE_PERIOD = float(os.getenv("THROTTLE_RATE_PERIOD", "10"))
+
+    # Handlers running at once; free slots go to admin scans, then ticket issuance, then the rest
+    SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "32"))
+
+    # Ticket QR images: local LRU cache, optionally backed by GridFS shared between instances
+    IMAGE_STORE_BACKEND = os.getenv("IMAGE_STORE_BACKEND", "local")  # 'local' | 'gridfs'
+    IMAGE_CACHE_DIR = os.getenv(
+        "IMAGE_CACHE_DIR",
+        os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'images')),
+    )
+    IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", "200"))
+    IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+    # Gate scans: photo sizes are tried from the smallest side (px) that decoded SCAN_SUCCESS_RATE
+    # of its last SCAN_HISTORY downloads (SCAN_START_SIDE until one did), never below SCAN_MIN_SIDE;
+    # every SCAN_PROBE_EVERY-th scan starts one size lower
+    SCAN_START_SIDE = int(os.getenv("SCAN_START_SIDE", "800"))
+    SCAN_MIN_SIDE = int(os.getenv("SCAN_MIN_SIDE", "320"))
+    SCAN_HISTORY = int(os.getenv("SCAN_HISTORY", "50"))
+    SCAN_SUCCESS_RATE = float(os.getenv("SCAN_SUCCESS_RATE", "0.8"))
+    SCAN_PROBE_EVERY = int(os.getenv("SCAN_PROBE_EVERY", "10"))
+
+    # CSV exports: new rows are appended to the files in <EXPORT_DIR>/<festival db>, a full re-read happens every N hours
+    EXPORT_DIR = os.getenv(
+        "EXPORT_DIR",
+        os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'exports')),
+    )
+    EXPORT_COMPACT_HOURS = float(os.getenv("EXPORT_COMPACT_HOURS", "24"))
+
+    # Users who blocked the bot are skipped by broadcasts and re-checked after this many hours
+    REACHABILITY_REPROBE_HOURS = float(os.getenv("REACHABILITY_REPROBE_HOURS", "24"))
+
+    # Persistent jobs (reminders, broadcasts): poll period, lease of a running job, messages
+    # between cancellation checks, pause between two messages (Telegram allows ~30 per second)
+    # and runs that may raise before the job is marked failed
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "30"))
+    JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+    JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "50"))
+    JOB_SEND_INTERVAL = float(os.getenv("JOB_SEND_INTERVAL", "0.05"))
+    JOB_MAX_FAILURES = int(os.getenv("JOB_MAX_FAILURES", "5"))
+
+    # Buffered event log (UTM hits): written in batches every N seconds or N entries
+    LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "2"))
+    LOG_FLUSH_SIZE = int(os.getenv("LOG_FLUSH_SIZE", "200"))
+
+    # Seconds to wait on shutdown for handlers that are still running (keep below the
+    # systemd TimeoutStopSec)
+    DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "20"))
+
+    # Local health endpoint (GET /health, /ready); port 0 disables it. Dependencies are probed
+    # every HEALTH_PROBE_INTERVAL seconds, readiness needs fresh successful probes and loop lag
+    # below HEALTH_MAX_LOOP_LAG seconds
+    HEALTH_HOST = os.getenv("HEALTH_HOST", "127.0.0.1")
+    HEALTH_PORT = int(os.getenv("HEALTH_PORT", "8088"))
+    HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "15"))
+    HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "5"))
+    HEALTH_MAX_LOOP_LAG = float(os.getenv("HEALTH_MAX_LOOP_LAG", "1"))
+
+    # Memory profiling (/memprofile): reports go to MEMPROFILE_DIR; tracemalloc runs from startup
+    # with MEMPROFILE_TRACE=1 or after the first /memprofile, keeping MEMPROFILE_FRAMES frames per
+    # allocation; a report is also written every MEMPROFILE_INTERVAL_HOURS (0 turns the timer off)
+    MEMPROFILE_DIR = os.getenv(
+        "MEMPROFILE_DIR",
+        os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'profiles')),
+    )
+    MEMPROFILE_TRACE = os.getenv("MEMPROFILE_TRACE", "0") == "1"
+    MEMPROFILE_FRAMES = int(os.getenv("MEMPROFILE_FRAMES", "1"))
+    MEMPROFILE_INTERVAL_HOURS = float(os.getenv("MEMPROFILE_INTERVAL_HOURS", "0"))
+
+    # Extra bots served by the same process (multi-bot mode), see Festival
+    FESTIVALS_FILE = os.getenv("FESTIVALS_FILE")
 
     bot: Bot = None
     lock = asyncio.Lock()
-    admins = []
 
-    # Ticketing season configuration
-    CURRENT_TICKET_SEASON = "2025"
+    # Ticketing season configuration of the main bot
+    TICKET_SEASON = "2025"
+    EVENT_DATES = ("date_27_11", "date_28_11")
+    # Maximum tickets of the current season; 0 means unlimited
+    TICKET_REGISTRATION_CAP = int(os.getenv("REGISTRATION_CAP", "0"))
+
+    # Per-bot values: those of the festival whose update (or background task) is being handled
+    @property
+    def CURRENT_TICKET_SEASON(self) -> str:
+        return current_festival.get().season
+
+    @property
+    def REGISTRATION_CAP(self) -> int:
+        return current_festival.get().registration_cap
+
+    @property
+    def admins(self) -> List[int]:
+        return current_festival.get().admins
+
+
+class Festival:
+    """One bot of the process with its own season, database and texts.
+
+    The main festival comes from the environment (``BOT_TOKEN``, ``MONGO_DB_NAME``,
+    ``Config.TICKET_SEASON``). ``FESTIVALS_FILE`` may list more as JSON objects::
+
+        [{"name": "side", "token_env": "SIDE_BOT_TOKEN", "season": "2025-side",
+          "db": "FEST_side", "registration_cap": 300,
+          "texts": {"ru": {"welcome_text": "..."}, "en": {"welcome_text": "..."}}}]
+
+    ``db`` is required and must differ from the database of every other festival:
+    users, jobs, reachability marks, admins and counters are kept per database.
+    Other omitted keys take the main festival's values. All festivals share the Mongo
+    client, the Redis storage (keys carry the bot id) and the image workers; the
+    event day ids (``Config.EVENT_DATES``) are those of the dialog, their labels
+    can be changed through ``texts``.
+    """
+
+    __slots__ = ("name", "token", "season", "db_name", "registration_cap", "texts", "admins")
+
+    def __init__(self, name: str, token: str, season: str, db_name: str, registration_cap: int = 0,
+                 texts: Optional[Dict[str, Dict[str, str]]] = None):
+        self.name = name
+        self.token = token
+        self.season = season
+        self.db_name = db_name
+        self.registration_cap = registration_cap
+        self.texts = texts or {}
+        self.admins: List[int] = []
+
+    @property
+    def bot_id(self) -> int:
+        return int(self.token.split(":", 1)[0])
+
+    def __repr__(self) -> str:
+        return f"Festival(name={self.name!r}, season={self.season!r}, db={self.db_name!r})"
+
+
+def load_festivals() -> List[Festival]:
+    main = Festival("main", Config.BOT_TOKEN, Config.TICKET_SEASON, Config.MONGO_DB_NAME,
+                    Config.TICKET_REGISTRATION_CAP)
+    festivals = [main]
+    if Config.FESTIVALS_FILE:
+        with open(Config.FESTIVALS_FILE, encoding="utf-8") as file:
+            entries = json.load(file)
+        for entry in entries:
+            token = os.getenv(entry["token_env"])
+            if not token:
+                raise ValueError(f"Не задан токен бота {entry['name']}: переменная {entry['token_env']} пуста.")
+            db_name = entry.get("db")
+            if not db_name or db_name in {festival.db_name for festival in festivals}:
+                raise ValueError(f"У бота {entry['name']} должна быть своя база данных: задайте уникальный \"db\".")
+            festivals.append(Festival(
+                entry["name"],
+                token,
+                entry.get("season", main.season),
+                db_name,
+                entry.get("registration_cap", main.registration_cap),
+                entry.get("texts"),
+            ))
+    return festivals
+
+
+festivals = load_festivals()
+_festivals_by_bot_id = {festival.bot_id: festival for festival in festivals}
+current_festival: ContextVar[Festival] = ContextVar("current_festival", default=festivals[0])
+
+
+def festival_for_bot(bot_id: int) -> Festival:
+    return _festivals_by_bot_id.get(bot_id, festivals[0])
+
+
+async def run_in_festival(festival: Festival, awaitable: Awaitable):
+    """Await ``awaitable`` with ``festival`` current; meant for tasks, whose context is their own."""
+    token = current_festival.set(festival)
+    try:
+        return await awaitable
+    finally:
+        current_festival.reset(token)
 
 
 config = Config()
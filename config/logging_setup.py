@@ -0,0 +1,52 @@
+"""Loguru sinks of the bot process.
+
+Both sinks are ``enqueue``-d: handlers only put the record on a queue and a
+background thread does the formatting and the disk writes. The file sink
+writes one JSON object per line (``serialize``), so the ``update_id`` and
+``duration_ms`` that ``UpdateLoggingMiddleware`` binds end up as fields, and
+rotated files are compressed. ``LOG_LEVELS`` raises or lowers the level of
+single modules, e.g. ``database.qr_helpers=WARNING,routers=DEBUG``.
+
+Log calls pass their values as arguments (``logger.info("... {}", value)``)
+rather than f-strings, so a message below the level is never formatted.
+"""
+
+import sys
+from typing import Dict
+
+from loguru import logger
+
+from config.bot_config import config
+
+
+def module_levels(spec: str, default: str) -> Dict[str, str]:
+    """Parse ``module=LEVEL,...`` into a loguru filter dict; ``""`` is the default level."""
+    levels = {"": default.upper()}
+    for item in spec.split(","):
+        module, _, level = item.partition("=")
+        if module.strip() and level.strip():
+            levels[module.strip()] = level.strip().upper()
+    return levels
+
+
+def _lowest(levels: Dict[str, str]) -> int:
+    return min(logger.level(level).no for level in levels.values())
+
+
+def setup_logging():
+    levels = module_levels(config.LOG_LEVELS, config.LOG_LEVEL)
+    stderr_levels = dict(levels)
+    stderr_levels[""] = config.LOG_STDERR_LEVEL.upper()
+    logger.remove()
+    logger.add(sys.stderr, level=_lowest(stderr_levels), filter=stderr_levels, enqueue=True)
+    if config.LOG_FILE:
+        logger.add(
+            config.LOG_FILE,
+            level=_lowest(levels),
+            filter=levels,
+            enqueue=True,
+            serialize=config.LOG_SERIALIZE,
+            rotation=config.LOG_ROTATION,
+            retention=config.LOG_RETENTION,
+            compression=config.LOG_COMPRESSION or None,
+        )
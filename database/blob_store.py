@@ -0,0 +1,151 @@
+"""Content-addressed storage for generated images.
+
+Ticket QR images are named after a hash of what is drawn on them, so every
+instance derives the same name for the same ticket. ``ImageStore`` reads
+through a local LRU cache (``LocalBlobStore``, bounded by
+``IMAGE_CACHE_MAX_MB``) and, when ``IMAGE_STORE_BACKEND`` is ``gridfs``, a
+GridFS bucket shared by all instances. An image is rendered only when
+neither has it.
+"""
+
+import hashlib
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+
+from config.bot_config import config
+
+# Bump when the ticket artwork changes so cached images are redrawn.
+TICKET_IMAGE_VERSION = 1
+
+
+def ticket_image_name(ticket_uuid: str, ticket_key: str) -> str:
+    digest = hashlib.sha256(f"{TICKET_IMAGE_VERSION}:{ticket_uuid}:{ticket_key}".encode()).hexdigest()
+    return f"ticket-{digest[:40]}.png"
+
+
+class LocalBlobStore:
+    """Directory of blobs evicted least-recently-used once ``max_bytes`` is exceeded."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def get(self, name: str) -> Optional[str]:
+        path = self.path(name)
+        try:
+            os.utime(path)  # mtime doubles as the LRU timestamp
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, name: str, data: bytes) -> str:
+        path = self.path(name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, path)
+        if self._size is None:
+            self._size = self._scan_size()
+        else:
+            self._size += len(data) - replaced
+        if self._size > self.max_bytes:
+            self.evict()
+        return path
+
+    def _entries(self):
+        with os.scandir(self.root) as entries:
+            return [entry for entry in entries if entry.is_file() and not entry.name.endswith(".tmp")]
+
+    def _scan_size(self) -> int:
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def evict(self, target_ratio: float = 0.8):
+        """Delete the least recently used blobs until usage drops below ``target_ratio`` of the limit."""
+        entries = sorted(((entry.stat(), entry.path) for entry in self._entries()), key=lambda item: item[0].st_mtime)
+        size = sum(stat.st_size for stat, _ in entries)
+        removed = 0
+        for stat, path in entries:
+            if size <= self.max_bytes * target_ratio:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            size -= stat.st_size
+            removed += 1
+        self._size = self._scan_size()
+        logger.info("LocalBlobStore.evict: removed {} blobs, {} bytes left", removed, self._size)
+
+
+class GridFSBlobStore:
+    """Blobs in a GridFS bucket of the bot database, shared between instances."""
+
+    def __init__(self, bucket_name: str = "images"):
+        self.bucket_name = bucket_name
+        self._bucket = None
+        self._bucket_db = None
+
+    def _get_bucket(self):
+        from database import database
+        # open_mongo after close_mongo binds a new database object; a bucket of the old one is closed
+        if self._bucket is None or self._bucket_db is not database.db:
+            from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+            self._bucket = AsyncIOMotorGridFSBucket(database.db, bucket_name=self.bucket_name)
+            self._bucket_db = database.db
+        return self._bucket
+
+    async def get(self, name: str) -> Optional[bytes]:
+        from gridfs.errors import NoFile
+        try:
+            stream = await self._get_bucket().open_download_stream_by_name(name)
+        except NoFile:
+            return None
+        return await stream.read()
+
+    async def put(self, name: str, data: bytes):
+        bucket = self._get_bucket()
+        # Two instances may render the same ticket at once; the content is identical either way.
+        if await bucket.find({"filename": name}).limit(1).to_list(length=1):
+            return
+        await bucket.upload_from_stream(name, data)
+
+
+class ImageStore:
+    def __init__(self, local: LocalBlobStore, shared: Optional[GridFSBlobStore] = None):
+        self.local = local
+        self.shared = shared
+
+    async def ensure(self, name: str, render: Callable[[], Awaitable[bytes]]) -> str:
+        """Return a local path of ``name``, fetching it from the shared store or rendering it."""
+        path = self.local.get(name)
+        if path:
+            return path
+        data = await self.shared.get(name) if self.shared else None
+        if data is None:
+            started = time.perf_counter()
+            data = await render()
+            logger.info("ImageStore: rendered {} in {:.3f}s", name, time.perf_counter() - started)
+            if self.shared:
+                await self.shared.put(name, data)
+        return self.local.put(name, data)
+
+
+def create_image_store() -> ImageStore:
+    local = LocalBlobStore(config.IMAGE_CACHE_DIR, config.IMAGE_CACHE_MAX_MB * 1024 * 1024)
+    shared = GridFSBlobStore() if config.IMAGE_STORE_BACKEND == "gridfs" else None
+    return ImageStore(local, shared)
+
+
+image_store = create_image_store()
@@ -0,0 +1,186 @@
+"""MongoDB client lifecycle.
+
+The client is opened from the dispatcher startup hook with the pool, timeout
+and compression settings from ``Config`` and closed on shutdown. A pool
+listener tracks connection usage so ``mongo_stats`` can report saturation,
+``ping_mongo`` measures round-trip latency, and ``retry_transient`` retries
+idempotent operations on network errors and primary step-downs.
+"""
+
+import asyncio
+import functools
+import time
+from typing import Any, Dict, Optional
+
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.errors import AutoReconnect, ConnectionFailure, NetworkTimeout
+
+from config.bot_config import config, festivals
+
+_TRANSIENT_ERRORS = (AutoReconnect, ConnectionFailure, NetworkTimeout)
+
+
+class _PoolMonitor(monitoring.ConnectionPoolListener):
+    """Counts connection checkouts across all server pools of the client."""
+
+    def __init__(self):
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.connections = 0
+
+    def connection_check_out_started(self, event):
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+
+    def connection_checked_out(self, event):
+        self.waiting = max(0, self.waiting - 1)
+        self.in_use += 1
+        self.checkouts += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def connection_check_out_failed(self, event):
+        self.waiting = max(0, self.waiting - 1)
+        self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        self.in_use = max(0, self.in_use - 1)
+
+    def connection_created(self, event):
+        self.connections += 1
+
+    def connection_closed(self, event):
+        self.connections = max(0, self.connections - 1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+_pool_monitor = _PoolMonitor()
+_client: Optional[AsyncIOMotorClient] = None
+_database = None
+_latency: Dict[str, Optional[float]] = {"last": None, "avg": None}
+
+
+def _bind(database):
+    global _database
+    from database import database as repository  # imported here: database.database imports this module
+    # the main festival's database, also when a tool attaches one under another name
+    repository.bind_database(database, config.MONGO_DB_NAME)
+    _database = database
+
+
+async def open_mongo():
+    """Create the client, bind the collections and check the server is reachable."""
+    global _client
+    if _database is not None:
+        return _database
+    logger.info("Entering: open_mongo(pool={}..{}, compressors={})",
+                config.MONGO_MIN_POOL_SIZE, config.MONGO_MAX_POOL_SIZE, config.MONGO_COMPRESSORS)
+    _client = AsyncIOMotorClient(
+        config.MONGO_URI,
+        maxPoolSize=config.MONGO_MAX_POOL_SIZE,
+        minPoolSize=config.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=config.MONGO_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=config.MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=config.MONGO_SOCKET_TIMEOUT_MS,
+        serverSelectionTimeoutMS=config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        waitQueueTimeoutMS=config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        compressors=config.MONGO_COMPRESSORS or None,
+        retryWrites=True,
+        retryReads=True,
+        event_listeners=[_pool_monitor],
+    )
+    _bind(_client[config.MONGO_DB_NAME])
+    # the other bots' databases share this client and its connection pool
+    from database import database as repository
+    for festival in festivals:
+        if festival.db_name != config.MONGO_DB_NAME:
+            repository.bind_database(_client[festival.db_name])
+    await ping_mongo()
+    logger.info("Exiting: open_mongo")
+    return _database
+
+
+def attach_database(database):
+    """Use an already created database object (for tools such as ``bench``)."""
+    _bind(database)
+
+
+async def close_mongo():
+    global _client, _database
+    logger.info("Entering: close_mongo")
+    if _client is not None:
+        _client.close()
+    from database import database as repository
+    repository.unbind_databases()
+    _client = None
+    _database = None
+    logger.info("Exiting: close_mongo")
+
+
+async def ping_mongo() -> float:
+    """Run ``ping`` against the server and return the round trip in seconds."""
+    started = time.perf_counter()
+    await _database.command("ping")
+    elapsed = time.perf_counter() - started
+    _latency["last"] = elapsed
+    _latency["avg"] = elapsed if _latency["avg"] is None else 0.8 * _latency["avg"] + 0.2 * elapsed
+    return elapsed
+
+
+def mongo_stats() -> Dict[str, Any]:
+    max_size = config.MONGO_MAX_POOL_SIZE or 1
+    return {
+        "connected": _database is not None,
+        "connections": _pool_monitor.connections,
+        "in_use": _pool_monitor.in_use,
+        "peak_in_use": _pool_monitor.peak_in_use,
+        "max_pool_size": config.MONGO_MAX_POOL_SIZE,
+        "saturation": _pool_monitor.in_use / max_size,
+        "peak_saturation": _pool_monitor.peak_in_use / max_size,
+        "waiting": _pool_monitor.waiting,
+        "peak_waiting": _pool_monitor.peak_waiting,
+        "checkouts": _pool_monitor.checkouts,
+        "checkout_failures": _pool_monitor.checkout_failures,
+        "last_ping_ms": _latency["last"] * 1000 if _latency["last"] is not None else None,
+        "avg_ping_ms": _latency["avg"] * 1000 if _latency["avg"] is not None else None,
+    }
+
+
+def retry_transient(func):
+    """Retry an idempotent coroutine on transient Mongo errors with exponential backoff."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        attempt = 1
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except _TRANSIENT_ERRORS as exc:
+                if attempt >= config.MONGO_RETRY_ATTEMPTS:
+                    raise
+                delay = 0.1 * 2 ** (attempt - 1)
+                logger.warning("{}: transient Mongo error ({!r}), retry {} in {:.1f}s",
+                               func.__name__, exc, attempt, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    return wrapper
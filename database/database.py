@@ -11,6 +11,10 @@ users
             "Lang": str,               # 'ru' | 'en'
             "StartDate": datetime,     # first /start usage
             "utm": str,                # optional marketing tag
+            "Unreachable": {           # set when a delivery failed for good, removed once reachable
+                "reason": str,         # 'blocked' | 'deactivated' | 'chat_not_found'
+                "at": datetime,
+            },
             "tickets": {
                 "2025": {
                     "uuid": str,                 # hex ticket identifier
@@ -35,27 +39,99 @@ config
     Key-value collection for operational state. Known keys: ``LastTicketKey`` (tracks the
     last numeric ticket suffix), ``Admins`` (array of privileged user IDs) and ``ScanLog``
     (array of scan audit entries with ``admin_id``, ``user_id``, ``scanned_at``).
+    ``ExportWatermark:<name>`` keeps the last exported ``(timestamp, _id)`` of an
+    incremental CSV export together with its row count and last compaction time.
+tickets_archive
+    Past seasons moved out of ``users`` by ``archive_past_seasons``. One document per user and
+    season: ``{"UserID": int, "season": str, "ticket": {...}, "archived_at": datetime}`` with a
+    unique ``(UserID, season)`` index. The ``ticket`` value keeps the ``tickets.<season>`` shape.
+jobs
+    Persistent scheduled jobs run by ``services.jobs``. Shape: ``{"key": str (unique),
+    "kind": str, "run_at": datetime,
+    "status": 'pending' | 'running' | 'done' | 'cancelled' | 'failed', "payload": dict,
+    "cursor": int | None, "stats": {outcome: int}, "failures": int, "lease_until": datetime,
+    "created_at": datetime, "finished_at": datetime}``. ``cursor`` is the last ``UserID``
+    handled, so a job resumed after a restart continues where it stopped. ``failures`` counts
+    runs that raised; the job is marked ``failed`` once it reaches ``JOB_MAX_FAILURES``.
+    Scheduling a ``key`` whose job is done, cancelled or failed replaces that job.
+counters
+    One document per season, ``{"_id": "season:<season>", "registered": int, "days":
+    {"<event_date_id>": int}, "attended": int, "checked_in": {"YYYY-MM-DD": int}, "scans":
+    {"YYYY-MM-DD": int}}``, kept up to date with ``$inc`` when tickets are issued, dates
+    confirmed and tickets scanned. Days of ``checked_in``/``scans`` are UTC dates; ``checked_in``
+    counts the first scan of a ticket on that day. ``rebuild_counters`` recomputes it.
 logs
     Event log with documents shaped as ``{"timestamp": datetime, "action": str,
     "details": dict}``. Used for UTM tracking and other append-only audit records.
 """
 
 import asyncio
-from datetime import datetime
-from typing import Any, Dict
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set
 
 import aiofiles
-from motor.motor_asyncio import AsyncIOMotorClient
 from loguru import logger
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 
-from config.bot_config import config
+from config.bot_config import config, current_festival
+from database.connection import retry_transient
+from database.records import SeasonTicket, UserProfile
 
-client = AsyncIOMotorClient(config.MONGO_URI)
-db = client.FEST
+# Bound by ``database.connection.open_mongo`` from the dispatcher startup hook: one database per
+# festival (see ``config.bot_config.Festival``), all on the same client.
+db = None
+_databases: Dict[str, Any] = {}
+
+
+def festival_database():
+    """Database of the current festival; raises if it was never bound."""
+    festival = current_festival.get()
+    database = _databases.get(festival.db_name)
+    if database is None:
+        # falling back to another festival's database would mix their users and tickets
+        raise RuntimeError(f"database {festival.db_name} of festival {festival.name} is not bound")
+    return database
+
+
+class _FestivalCollection:
+    """A collection of the current festival's database; attribute access goes to the real one."""
+
+    __slots__ = ("_name",)
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(festival_database()[self._name], attr)
+
+
+users_collection = _FestivalCollection("users")
+config_collection = _FestivalCollection("config")
+logs_collection = _FestivalCollection("logs")
+tickets_archive_collection = _FestivalCollection("tickets_archive")
+jobs_collection = _FestivalCollection("jobs")
+counters_collection = _FestivalCollection("counters")
+
+
+def bind_database(database, db_name: Optional[str] = None):
+    """Register ``database`` for the festivals whose ``db_name`` is ``db_name`` (its own name by default).
+
+    The first database bound is also kept as ``db``.
+    """
+    global db
+    if db is None:
+        db = database
+    _databases[db_name or database.name] = database
+
+
+def unbind_databases():
+    global db
+    db = None
+    _databases.clear()
 
-users_collection = db.users
-config_collection = db.config
-logs_collection = db.logs
 
 _TICKET_FIELD_MAP = {
     "TicketUUID": "uuid",
@@ -71,30 +147,89 @@ _QUESTION_FIELD_MAP = {
 
 _DATE_FIELDS = ("date_4_10", "date_5_10", "date_6_10")
 
+_LEGACY_FIELDS = tuple(_TICKET_FIELD_MAP) + tuple(_QUESTION_FIELD_MAP) + _DATE_FIELDS
+
+_ARCHIVE_CHECKPOINT_KEY = "TicketsArchiveCheckpoint"
+
+# Ticket fields read by the dialogs; questionnaire and past seasons stay on the server.
+_PROFILE_TICKET_FIELDS = ("uuid", "key", "created_at", "last_scanned_at", "dates")
+
+
+def _profile_projection(season: str) -> Dict[str, int]:
+    projection = {"_id": 0, "UserID": 1, "Lang": 1}
+    for field in _PROFILE_TICKET_FIELDS:
+        projection[f"tickets.{season}.{field}"] = 1
+    return projection
+
+
+@retry_transient
+async def get_user_profile(user_id: int, season: Optional[str] = None) -> Optional[UserProfile]:
+    """Load the language and one season's ticket of a user with a projected query."""
+    logger.info("Entering: get_user_profile(user_id={})", user_id)
+    season = season or config.CURRENT_TICKET_SEASON
+    document = await users_collection.find_one({"UserID": user_id}, _profile_projection(season))
+    logger.info("Exiting: get_user_profile")
+    return UserProfile.from_document(document, season)
+
+
+@retry_transient
+async def find_ticket_holder(ticket_uuid: str, season: Optional[str] = None) -> Optional[UserProfile]:
+    """Resolve the owner of a ticket uuid within ``season`` (current season by default)."""
+    logger.info("Entering: find_ticket_holder(ticket_uuid={})", ticket_uuid)
+    season = season or config.CURRENT_TICKET_SEASON
+    document = await users_collection.find_one({f"tickets.{season}.uuid": ticket_uuid}, _profile_projection(season))
+    logger.info("Exiting: find_ticket_holder")
+    return UserProfile.from_document(document, season)
 
-async def get_user_data(user_id, ticket_key=None):
-    logger.info(f"Entering: get_user_data(user_id={user_id}, ticket_key={ticket_key})")
-    if ticket_key:
-        season = config.CURRENT_TICKET_SEASON
-        result = await users_collection.find_one({f"tickets.{season}.uuid": ticket_key})
-    else:
-        result = await users_collection.find_one({"UserID": user_id})
-    logger.info(f"Exiting: get_user_data")
-    return result
 
+@retry_transient
+async def find_ticket_holder_by_key(ticket_key: str, season: Optional[str] = None) -> Optional[UserProfile]:
+    """Resolve the owner of a printed ticket key (``"011"``) within ``season``."""
+    logger.info("Entering: find_ticket_holder_by_key(ticket_key={})", ticket_key)
+    season = season or config.CURRENT_TICKET_SEASON
+    document = await users_collection.find_one({f"tickets.{season}.key": ticket_key}, _profile_projection(season))
+    logger.info("Exiting: find_ticket_holder_by_key")
+    return UserProfile.from_document(document, season)
 
+
+async def register_start(user_id: int, lang: Optional[str], utm: Optional[str] = None):
+    """Record a /start in one round trip.
+
+    ``StartDate`` is written when the document has none yet (new users and old documents
+    without it), ``Lang`` (and ``utm`` when given) on every call, and an ``Unreachable`` mark
+    is dropped since the user is back.
+    """
+    logger.info("Entering: register_start(user_id={}, lang={}, utm={})", user_id, lang, utm)
+    # an update pipeline, so StartDate can depend on the stored value; $literal keeps
+    # user-supplied strings from being read as field paths
+    update: Dict[str, Any] = {
+        "Lang": {"$literal": lang},
+        "StartDate": {"$ifNull": ["$StartDate", datetime.utcnow()]},
+    }
+    if utm:
+        update["utm"] = {"$literal": utm}
+    await users_collection.update_one(
+        {"UserID": user_id},
+        [{"$set": update}, {"$project": {"Unreachable": 0}}],
+        upsert=True,
+    )
+    logger.info("Exiting: register_start")
+
+
+@retry_transient
 async def update_user_data(user_id, data):
-    logger.info(f"Entering: update_user_data(user_id={user_id}, data={data})")
+    logger.info("Entering: update_user_data(user_id={}, fields={})", user_id, list(data))
     await users_collection.update_one(
         {"UserID": user_id},
         {"$set": data},
         upsert=True
     )
-    logger.info(f"Exiting: update_user_data")
+    logger.info("Exiting: update_user_data")
 
 
+@retry_transient
 async def get_last_key() -> str:
-    logger.info(f"Entering: get_last_key")
+    logger.info("Entering: get_last_key")
     season = config.CURRENT_TICKET_SEASON
     key_name = f"LastTicketKey_{season}"
     last_key = await config_collection.find_one({"Key": key_name})
@@ -113,15 +248,53 @@ async def get_last_key() -> str:
                 {"$set": {"Value": start_key}},
                 upsert=True
             )
-            logger.info(f"Exiting: get_last_key with key {ticket_key}")
+            logger.info("Exiting: get_last_key with key {}", ticket_key)
             return ticket_key
         start_key += 1
 
 
+@retry_transient
 async def delete_user_data(user_id: int):
-    logger.info(f"Entering: delete_user_data(user_id={user_id})")
-    await users_collection.delete_one({"UserID": user_id})
-    logger.info(f"Exiting: delete_user_data")
+    """Delete the user; a current-season ticket gives its place and day counts back."""
+    logger.info("Entering: delete_user_data(user_id={})", user_id)
+    season = config.CURRENT_TICKET_SEASON
+    deleted = await users_collection.find_one_and_delete({"UserID": user_id}, projection={f"tickets.{season}": 1})
+    ticket = SeasonTicket.from_document(season, deleted)
+    if ticket is not None and ticket.uuid:
+        # the same counts rebuild_counters derives from the ticket; scans and check-ins stay history
+        decrements = {"registered": -1}
+        decrements.update({f"days.{date_id}": -1 for date_id, selected in ticket.dates.items() if selected})
+        if ticket.last_scanned_at is not None:
+            decrements["attended"] = -1
+        await counters_collection.update_one({"_id": _counters_id(season)}, {"$inc": decrements})
+    logger.info("Exiting: delete_user_data")
+
+
+def _legacy_ticket_entry(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a ``tickets.<season>`` entry from the legacy top-level fields of ``user``."""
+    ticket_entry: Dict[str, Any] = {}
+
+    for mongo_key, nested_key in _TICKET_FIELD_MAP.items():
+        value = user.get(mongo_key)
+        if value is not None:
+            ticket_entry[nested_key] = value
+
+    questionnaire: Dict[str, Any] = {}
+    for mongo_key, nested_key in _QUESTION_FIELD_MAP.items():
+        value = user.get(mongo_key)
+        if value is not None:
+            questionnaire[nested_key] = value
+    if questionnaire:
+        ticket_entry["questionnaire"] = questionnaire
+
+    dates: Dict[str, bool] = {}
+    for date_field in _DATE_FIELDS:
+        if date_field in user:
+            dates[date_field] = bool(user.get(date_field))
+    if dates:
+        ticket_entry["dates"] = dates
+
+    return ticket_entry
 
 
 async def migrate_ticket_fields_to_season(
@@ -153,13 +326,7 @@ async def migrate_ticket_fields_to_season(
         remove_original_fields,
     )
 
-    legacy_fields = (
-        set(_TICKET_FIELD_MAP.keys())
-        | set(_QUESTION_FIELD_MAP.keys())
-        | set(_DATE_FIELDS)
-    )
-
-    legacy_filter = {"$or": [{field: {"$exists": True}} for field in legacy_fields]}
+    legacy_filter = {"$or": [{field: {"$exists": True}} for field in _LEGACY_FIELDS]}
 
     migrated = 0
     skipped = 0
@@ -170,27 +337,7 @@ async def migrate_ticket_fields_to_season(
             skipped += 1
             continue
 
-        ticket_entry: Dict[str, Any] = {}
-
-        for mongo_key, nested_key in _TICKET_FIELD_MAP.items():
-            value = user.get(mongo_key)
-            if value is not None:
-                ticket_entry[nested_key] = value
-
-        questionnaire: Dict[str, Any] = {}
-        for mongo_key, nested_key in _QUESTION_FIELD_MAP.items():
-            value = user.get(mongo_key)
-            if value is not None:
-                questionnaire[nested_key] = value
-        if questionnaire:
-            ticket_entry["questionnaire"] = questionnaire
-
-        dates: Dict[str, bool] = {}
-        for date_field in _DATE_FIELDS:
-            if date_field in user:
-                dates[date_field] = bool(user.get(date_field))
-        if dates:
-            ticket_entry["dates"] = dates
+        ticket_entry = _legacy_ticket_entry(user)
 
         if not ticket_entry:
             skipped += 1
@@ -235,110 +382,831 @@ async def migrate_ticket_fields_to_season(
     return {"migrated": migrated, "skipped": skipped}
 
 
-async def add_log(action: str, details: dict = None):
-    logger.info(f"Entering: add_log(action={action}, details={details})")
-    log_entry = {
+async def probe_users_collection():
+    """Cheapest real query on ``users`` (``_id`` index, no documents returned) for health checks."""
+    await users_collection.find_one({"_id": 0}, {"_id": 1})
+
+
+async def ensure_indexes():
+    """Create the indexes the bot relies on. Safe to call on every startup."""
+    logger.info("Entering: ensure_indexes")
+    await tickets_archive_collection.create_index(
+        [("UserID", ASCENDING), ("season", ASCENDING)],
+        unique=True,
+        name="user_season",
+    )
+    # incremental exports read in (created_at|timestamp, _id) order after the last watermark
+    season = config.CURRENT_TICKET_SEASON
+    await users_collection.create_index(
+        [(f"tickets.{season}.created_at", ASCENDING), ("_id", ASCENDING)],
+        name=f"ticket_created_{season}",
+    )
+    await logs_collection.create_index(
+        [("action", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+        name="action_timestamp",
+    )
+    # manual check-in by the printed key and get_last_key
+    await users_collection.create_index(
+        [(f"tickets.{season}.key", ASCENDING)],
+        name=f"ticket_key_{season}",
+        sparse=True,
+    )
+    # broadcast segments (iter_segment_user_ids) filter by language and utm tag
+    await users_collection.create_index([("Lang", ASCENDING)], name="lang")
+    await users_collection.create_index([("utm", ASCENDING)], name="utm", sparse=True)
+    # not sparse: segments look up users *without* the field
+    await users_collection.create_index([("Unreachable.at", ASCENDING)], name="unreachable")
+    await jobs_collection.create_index([("key", ASCENDING)], unique=True, name="key")
+    await jobs_collection.create_index([("status", ASCENDING), ("run_at", ASCENDING)], name="status_run_at")
+    logger.info("Exiting: ensure_indexes")
+
+
+async def archive_past_seasons(
+    current_season: Optional[str] = None,
+    *,
+    legacy_season: str = "2024",
+    batch_size: int = 500,
+) -> Dict[str, int]:
+    """Move non-current seasons from ``users`` into ``tickets_archive``.
+
+    Users are processed in ``_id`` order in batches. Each batch is first upserted into
+    the archive and only then unset from ``users``, so re-running after a failure never
+    loses data. The last processed ``_id`` is stored under ``TicketsArchiveCheckpoint``
+    in ``config``; an interrupted run resumes from there and a finished run clears it.
+
+    Parameters
+    ----------
+    current_season
+        Season that stays in ``users``. Defaults to ``config.CURRENT_TICKET_SEASON``.
+    legacy_season
+        Season the legacy top-level ticket fields belong to. They are archived under this
+        season (unless ``tickets.<legacy_season>`` already holds the migrated copy) and
+        removed from ``users``.
+    batch_size
+        Number of users per bulk write.
+
+    Returns
+    -------
+    dict
+        Counters: ``users`` (documents trimmed), ``seasons`` (archive entries written)
+        and ``legacy`` (documents whose legacy fields were removed).
+    """
+    logger.info("Entering: archive_past_seasons(current_season={}, batch_size={})",
+                current_season, batch_size)
+    current_season = current_season or config.CURRENT_TICKET_SEASON
+    await ensure_indexes()
+
+    checkpoint = await config_collection.find_one({"Key": _ARCHIVE_CHECKPOINT_KEY})
+    query: Dict[str, Any] = {
+        "$or": [{field: {"$exists": True}} for field in ("tickets",) + _LEGACY_FIELDS]
+    }
+    if checkpoint and checkpoint.get("Value") is not None:
+        logger.info("archive_past_seasons: resuming after _id={}", checkpoint['Value'])
+        query["_id"] = {"$gt": checkpoint["Value"]}
+
+    projection = {"UserID": 1, "tickets": 1}
+    projection.update({field: 1 for field in _LEGACY_FIELDS})
+
+    counters = {"users": 0, "seasons": 0, "legacy": 0}
+    archive_ops: List[UpdateOne] = []
+    user_ops: List[UpdateOne] = []
+    last_id = None
+
+    async def flush():
+        if archive_ops:
+            await tickets_archive_collection.bulk_write(archive_ops, ordered=False)
+        if user_ops:
+            await users_collection.bulk_write(user_ops, ordered=False)
+        if last_id is not None:
+            await config_collection.update_one(
+                {"Key": _ARCHIVE_CHECKPOINT_KEY},
+                {"$set": {"Value": last_id}},
+                upsert=True
+            )
+        archive_ops.clear()
+        user_ops.clear()
+
+    now = datetime.utcnow()
+    cursor = users_collection.find(query, projection).sort("_id", ASCENDING).batch_size(batch_size)
+    async for user in cursor:
+        last_id = user["_id"]
+        tickets = user.get("tickets") if isinstance(user.get("tickets"), dict) else {}
+        entries = {season: info for season, info in tickets.items() if season != current_season}
+
+        legacy_present = [field for field in _LEGACY_FIELDS if field in user] if legacy_season != current_season else []
+        if legacy_present and legacy_season not in tickets:
+            legacy_entry = _legacy_ticket_entry(user)
+            if legacy_entry:
+                entries[legacy_season] = legacy_entry
+
+        unset_ops = {f"tickets.{season}": "" for season in entries if season in tickets}
+        unset_ops.update({field: "" for field in legacy_present})
+        if not unset_ops:
+            continue
+
+        for season, info in entries.items():
+            archive_ops.append(UpdateOne(
+                {"UserID": user.get("UserID"), "season": season},
+                {"$set": {"ticket": info, "archived_at": now}},
+                upsert=True
+            ))
+        user_ops.append(UpdateOne({"_id": user["_id"]}, {"$unset": unset_ops}))
+        counters["users"] += 1
+        counters["seasons"] += len(entries)
+        if legacy_present:
+            counters["legacy"] += 1
+
+        if len(user_ops) >= batch_size:
+            await flush()
+
+    await flush()
+    await config_collection.delete_one({"Key": _ARCHIVE_CHECKPOINT_KEY})
+    logger.info("Exiting: archive_past_seasons ({})", counters)
+    return counters
+
+
+@retry_transient
+async def get_archived_ticket(user_id: int, season: str) -> Optional[SeasonTicket]:
+    logger.info("Entering: get_archived_ticket(user_id={}, season={})", user_id, season)
+    document = await tickets_archive_collection.find_one({"UserID": user_id, "season": season})
+    logger.info("Exiting: get_archived_ticket")
+    return SeasonTicket.from_entry(season, document.get("ticket")) if document else None
+
+
+@retry_transient
+async def get_ticket_history(user_id: int) -> List[SeasonTicket]:
+    """Return the archived seasons of a user, oldest first."""
+    logger.info("Entering: get_ticket_history(user_id={})", user_id)
+    history = []
+    cursor = tickets_archive_collection.find({"UserID": user_id}).sort("season", ASCENDING)
+    async for document in cursor:
+        ticket = SeasonTicket.from_entry(document["season"], document.get("ticket"))
+        if ticket:
+            history.append(ticket)
+    logger.info("Exiting: get_ticket_history")
+    return history
+
+
+def _counters_id(season: str) -> str:
+    return f"season:{season}"
+
+
+async def ensure_counters(season: Optional[str] = None):
+    """Create the counters of ``season`` if they are missing.
+
+    They are computed by ``rebuild_counters``, so a season that already has tickets (a database
+    from before the counters, or a festival added later) starts with its real totals.
+    """
+    season = season or config.CURRENT_TICKET_SEASON
+    logger.info("Entering: ensure_counters(season={})", season)
+    if await counters_collection.find_one({"_id": _counters_id(season)}, {"_id": 1}) is None:
+        await rebuild_counters(season)
+    logger.info("Exiting: ensure_counters")
+
+
+async def reserve_registration(season: str, cap: int = 0) -> bool:
+    """Count a new ticket of ``season``; with a ``cap`` only while fewer than ``cap`` are issued.
+
+    The check and the increment are one ``update_one`` on the season counter, so concurrent
+    registrations can never overshoot the cap.
+    """
+    query: Dict[str, Any] = {"_id": _counters_id(season)}
+    if cap:
+        # the document is created by ensure_counters; upserting here would hit a duplicate _id when full
+        query["registered"] = {"$lt": cap}
+    result = await counters_collection.update_one(query, {"$inc": {"registered": 1}}, upsert=not cap)
+    return result.modified_count == 1 or result.upserted_id is not None
+
+
+async def release_registration(season: str):
+    await counters_collection.update_one({"_id": _counters_id(season)}, {"$inc": {"registered": -1}})
+
+
+async def commit_questionnaire(
+    user_id: int,
+    season: str,
+    answers: Dict[str, str],
+    dates: Dict[str, bool],
+):
+    """Store the questionnaire ``answers`` and selected ``dates`` of a ticket in one update.
+
+    The per-day counters are moved by the change against the previous dates, so confirming
+    the same selection twice does not count it twice.
+    """
+    logger.info("Entering: commit_questionnaire(user_id={}, answers={}, dates={})", user_id, answers, dates)
+    update = {f"tickets.{season}.questionnaire.{field}": value for field, value in answers.items()}
+    update.update({f"tickets.{season}.dates.{date_id}": selected for date_id, selected in dates.items()})
+    previous = await users_collection.find_one_and_update(
+        {"UserID": user_id},
+        {"$set": update},
+        projection={f"tickets.{season}.dates": 1, "_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+    before = (((previous or {}).get("tickets") or {}).get(season) or {}).get("dates") or {}
+    changes = {
+        f"days.{date_id}": int(selected) - int(bool(before.get(date_id)))
+        for date_id, selected in dates.items()
+        if bool(before.get(date_id)) != selected
+    }
+    if changes:
+        await counters_collection.update_one({"_id": _counters_id(season)}, {"$inc": changes}, upsert=True)
+    logger.info("Exiting: commit_questionnaire")
+
+
+async def record_ticket_scan(user_id: int, season: str):
+    """Set ``last_scanned_at`` of the ticket and count the scan, check-in and attendance."""
+    logger.info("Entering: record_ticket_scan(user_id={}, season={})", user_id, season)
+    now = datetime.utcnow()
+    day = now.strftime("%Y-%m-%d")
+    previous = await users_collection.find_one_and_update(
+        {"UserID": user_id},
+        {"$set": {f"tickets.{season}.last_scanned_at": now}},
+        projection={f"tickets.{season}.last_scanned_at": 1, "_id": 0},
+        return_document=ReturnDocument.BEFORE,
+    )
+    last_scanned_at = (((previous or {}).get("tickets") or {}).get(season) or {}).get("last_scanned_at")
+    increments = {f"scans.{day}": 1}
+    if not isinstance(last_scanned_at, datetime) or last_scanned_at.strftime("%Y-%m-%d") != day:
+        increments[f"checked_in.{day}"] = 1
+    if last_scanned_at is None:
+        increments["attended"] = 1
+    await counters_collection.update_one({"_id": _counters_id(season)}, {"$inc": increments}, upsert=True)
+    logger.info("Exiting: record_ticket_scan")
+
+
+async def get_counters(season: Optional[str] = None) -> Dict[str, Any]:
+    season = season or config.CURRENT_TICKET_SEASON
+    return await counters_collection.find_one({"_id": _counters_id(season)}) or {}
+
+
+async def rebuild_counters(season: Optional[str] = None) -> Dict[str, Any]:
+    """Recompute the counters of ``season`` from ``users`` and the scan log.
+
+    ``registered``, ``days`` and ``attended`` come from the ticket documents, ``checked_in``
+    and ``scans`` from ``ScanLog`` (only scans since the ticket was issued in ``season`` are
+    meaningful, so call it for the current season).
+    """
+    season = season or config.CURRENT_TICKET_SEASON
+    logger.info("Entering: rebuild_counters(season={})", season)
+    ticket = f"$tickets.{season}"
+    group: Dict[str, Any] = {"_id": None, "registered": {"$sum": 1}}
+    group["attended"] = {"$sum": {"$cond": [{"$ifNull": [f"{ticket}.last_scanned_at", False]}, 1, 0]}}
+    for date_id in config.EVENT_DATES:
+        group[date_id] = {"$sum": {"$cond": [{"$eq": [f"{ticket}.dates.{date_id}", True]}, 1, 0]}}
+    totals = await users_collection.aggregate([
+        {"$match": {f"tickets.{season}.uuid": {"$exists": True}}},
+        {"$group": group},
+    ]).to_list(length=1)
+    totals = totals[0] if totals else {}
+
+    scans: Dict[str, int] = {}
+    checked_in: Dict[str, int] = {}
+    seen = set()
+    scan_log = await config_collection.find_one({"Key": "ScanLog"}) or {}
+    for entry in scan_log.get("Value", []):
+        scanned_at = entry.get("scanned_at")
+        if not isinstance(scanned_at, datetime):
+            continue
+        day = scanned_at.strftime("%Y-%m-%d")
+        scans[day] = scans.get(day, 0) + 1
+        if (entry.get("user_id"), day) not in seen:
+            seen.add((entry.get("user_id"), day))
+            checked_in[day] = checked_in.get(day, 0) + 1
+
+    counters = {
+        "registered": totals.get("registered", 0),
+        "days": {date_id: totals.get(date_id, 0) for date_id in config.EVENT_DATES},
+        "attended": totals.get("attended", 0),
+        "checked_in": checked_in,
+        "scans": scans,
+    }
+    await counters_collection.replace_one({"_id": _counters_id(season)}, counters, upsert=True)
+    logger.info("Exiting: rebuild_counters({})", counters)
+    return counters
+
+
+# Log entries waiting for ``flush_logs`` per festival database; ``queue_log`` keeps log writes
+# off the request path.
+_log_buffers: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+# flushes started by ``queue_log``; the loop keeps only weak references to tasks
+_flush_tasks: Set[asyncio.Task] = set()
+
+
+def queue_log(action: str, details: dict = None):
+    """Buffer a log entry; it is written by the next ``flush_logs`` in one ``insert_many``."""
+    buffer = _log_buffers[current_festival.get().db_name]
+    buffer.append({
         "timestamp": datetime.utcnow(),
         "action": action,
         "details": details or {}
-    }
-    await logs_collection.insert_one(log_entry)
-    logger.info(f"Exiting: add_log")
+    })
+    if len(buffer) >= config.LOG_FLUSH_SIZE:
+        task = asyncio.ensure_future(flush_logs())
+        _flush_tasks.add(task)
+        task.add_done_callback(_flush_tasks.discard)
+
+
+async def flush_logs() -> int:
+    """Write the buffered entries of the current festival."""
+    buffer = _log_buffers[current_festival.get().db_name]
+    if not buffer:
+        return 0
+    entries = buffer[:]
+    del buffer[:]
+    # insert_many sets ``_id`` on the entries, so a retried entry that was written after all
+    # fails with a duplicate key error and is dropped instead of being stored twice
+    try:
+        await logs_collection.insert_many(entries, ordered=False)
+    except BulkWriteError as exc:
+        failed = [error for error in exc.details.get("writeErrors", []) if error.get("code") != 11000]
+        retry = [entries[error["index"]] for error in failed]
+        written = exc.details.get("nInserted", 0)
+        logger.warning("flush_logs: wrote {} of {} entries, {} will retry", written, len(entries), len(retry))
+        buffer[:0] = retry
+        return written
+    except Exception as exc:
+        logger.warning("flush_logs: {} entries not written, will retry: {!r}", len(entries), exc)
+        buffer[:0] = entries
+        return 0
+    logger.info("flush_logs: wrote {} entries", len(entries))
+    return len(entries)
+
+
+async def log_flush_loop():
+    while True:
+        await asyncio.sleep(config.LOG_FLUSH_INTERVAL)
+        await flush_logs()
 
 
 # Универсальная функция для сохранения данных в CSV файл
-async def save_to_csv(filename, data, headers):
-    logger.info(f"Entering: save_to_csv(filename={filename})")
-    async with aiofiles.open(filename, mode='w', newline='', encoding='utf-8') as file:
-        await file.write(','.join(headers) + '\n')
+async def save_to_csv(filename, data, headers, append=False):
+    logger.info("Entering: save_to_csv(filename={}, append={})", filename, append)
+    write_header = not append or not os.path.isfile(filename) or os.path.getsize(filename) == 0
+    async with aiofiles.open(filename, mode='a' if append else 'w', newline='', encoding='utf-8') as file:
+        if write_header:
+            await file.write(','.join(headers) + '\n')
 
         for item in data:
             row = [str(item.get(header, "N/A")).replace('\n', ' ').replace('\r', '') for header in headers]
             await file.write(','.join(row) + '\n')
-    logger.info(f"Exiting: save_to_csv")
+    logger.info("Exiting: save_to_csv")
 
 
-async def export_utm_to_csv():
-    logger.info(f"Entering: export_utm_to_csv")
-    utm_logs = await logs_collection.find({"action": "utm"}).to_list(length=None)
+def _format_date(value) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S") if isinstance(value, datetime) else "N/A"
 
-    utm_data = []
-    for log in utm_logs:
-        details = log.get("details", {})
-        utm_data.append({
-            "date": log.get("timestamp", "N/A").strftime("%Y-%m-%d %H:%M:%S") if isinstance(log.get("timestamp"),
-                                                                                            datetime) else "N/A",
-            "user_id": details.get("user_id", "N/A"),
-            "utm_data": details.get("utm_data", "N/A")
-        })
 
-    await save_to_csv('data/output.csv', utm_data, ["date", "user_id", "utm_data"])
-    logger.info(f"Exiting: export_utm_to_csv")
-    return utm_data
+_export_locks: Dict[str, asyncio.Lock] = {}
 
 
-async def export_tickets_to_csv():
-    logger.info(f"Entering: export_tickets_to_csv")
-    season = config.CURRENT_TICKET_SEASON
-    legacy_filter = {f"tickets.{season}": {"$exists": True}}
-    data = []
-    async for user in users_collection.find(legacy_filter):
-        user_id = user.get("UserID", "N/A")
-        ticket_info = (user.get("tickets") or {}).get(season)
-        if not ticket_info:
+def _nested_get(document: Dict[str, Any], dotted: str):
+    value = document
+    for part in dotted.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _after_watermark(field: str, watermark: Dict[str, Any]) -> Dict[str, Any]:
+    """Filter for documents sorted after ``watermark`` by ``(field, _id)``."""
+    return {"$or": [
+        {field: {"$gt": watermark["at"]}},
+        {field: watermark["at"], "_id": {"$gt": watermark["id"]}},
+    ]}
+
+
+async def _incremental_export(
+    name: str,
+    collection,
+    base_filter: Dict[str, Any],
+    sort_field: str,
+    projection: Dict[str, int],
+    to_row,
+    headers: List[str],
+    mode: str = "full",
+) -> Dict[str, Any]:
+    """Export the rows of ``collection`` added since the previous run.
+
+    Parameters
+    ----------
+    name : str
+        Export name, used for the file names and the ``ExportWatermark:<name>`` config key.
+    base_filter : dict
+        Query selecting every exported document.
+    sort_field : str
+        Datetime field the documents are appended in; ``(sort_field, _id)`` is the high-water mark.
+    to_row : callable
+        Converts a document into a CSV row dict, or returns ``None`` to skip it.
+    mode : str
+        ``full`` returns the cumulative file, ``delta`` a file with the new rows only and
+        ``compact`` forces a full re-read.
+
+    Returns
+    -------
+    dict
+        ``path`` of the file to send, ``rows`` in it, ``new`` rows since the previous run and
+        whether the cumulative file was ``compacted``.
+
+    Notes
+    -----
+    New rows are appended to ``<name>.csv`` in the ``EXPORT_DIR/<db_name>`` directory of the
+    current festival so a repeated export reads only new documents.
+    Every ``EXPORT_COMPACT_HOURS`` (or when the file is missing) the whole collection is read
+    again and the file rewritten, which picks up edited, deleted and legacy records that have
+    no ``sort_field``.
+    """
+    logger.info("Entering: _incremental_export(name={}, mode={})", name, mode)
+    db_name = current_festival.get().db_name
+    async with _export_locks.setdefault(f"{db_name}:{name}", asyncio.Lock()):
+        result = await _export_locked(name, collection, base_filter, sort_field, projection, to_row, headers, mode)
+    logger.info("Exiting: _incremental_export(name={}, new={}, compacted={})",
+                name, result["new"], result["compacted"])
+    return result
+
+
+async def _export_locked(name, collection, base_filter, sort_field, projection, to_row, headers, mode):
+    # two admins exporting at once would otherwise append the same rows twice
+    # the watermark lives in the festival's database, so its files do too
+    export_dir = os.path.join(config.EXPORT_DIR, current_festival.get().db_name)
+    os.makedirs(export_dir, exist_ok=True)
+    full_path = os.path.join(export_dir, f"{name}.csv")
+    delta_path = os.path.join(export_dir, f"{name}-delta.csv")
+    state_key = f"ExportWatermark:{name}"
+
+    state_entry = await config_collection.find_one({"Key": state_key})
+    state = state_entry["Value"] if state_entry else {}
+    watermark = state.get("watermark")
+    now = datetime.utcnow()
+    compacted_at = state.get("compacted_at")
+    compact = (
+        mode == "compact"
+        or not os.path.isfile(full_path)
+        or compacted_at is None
+        or now - compacted_at >= timedelta(hours=config.EXPORT_COMPACT_HOURS)
+    )
+
+    query = dict(base_filter)
+    if not compact and watermark:
+        query.update(_after_watermark(sort_field, watermark))
+    cursor = collection.find(query, projection).sort([(sort_field, ASCENDING), ("_id", ASCENDING)])
+
+    rows, new_rows = [], []
+    new_watermark = watermark
+    async for document in cursor:
+        row = to_row(document)
+        if row is None:
+            continue
+        rows.append(row)
+        at = _nested_get(document, sort_field)
+        if not isinstance(at, datetime):
+            # legacy records without the field sort first and are only seen by compaction
+            if not watermark:
+                new_rows.append(row)
             continue
+        if not watermark or (at, document["_id"]) > (watermark["at"], watermark["id"]):
+            new_rows.append(row)
+        new_watermark = {"at": at, "id": document["_id"]}
+
+    if compact:
+        tmp_path = f"{full_path}.tmp"
+        await save_to_csv(tmp_path, rows, headers)
+        os.replace(tmp_path, full_path)
+        total = len(rows)
+        compacted_at = now
+    else:
+        await save_to_csv(full_path, new_rows, headers, append=True)
+        total = state.get("rows", 0) + len(new_rows)
+    await save_to_csv(delta_path, new_rows, headers)
+
+    await config_collection.update_one(
+        {"Key": state_key},
+        {"$set": {"Value": {
+            "watermark": new_watermark,
+            "rows": total,
+            "compacted_at": compacted_at,
+            "exported_at": now,
+        }}},
+        upsert=True,
+    )
+    return {
+        "path": delta_path if mode == "delta" else full_path,
+        "rows": len(new_rows) if mode == "delta" else total,
+        "new": len(new_rows),
+        "compacted": compact,
+    }
 
-        created_at = ticket_info.get("created_at", "N/A")
-        if isinstance(created_at, datetime):
-            created_at = created_at.strftime("%Y-%m-%d %H:%M:%S")
 
-        data.append({
+def _utm_row(log: Dict[str, Any]) -> Dict[str, Any]:
+    details = log.get("details", {})
+    return {
+        "date": _format_date(log.get("timestamp")),
+        "user_id": details.get("user_id", "N/A"),
+        "utm_data": details.get("utm_data", "N/A"),
+    }
+
+
+async def export_utm_to_csv(mode: str = "full") -> Dict[str, Any]:
+    logger.info("Entering: export_utm_to_csv(mode={})", mode)
+    # buffered entries carry earlier timestamps than the watermark would after this export
+    await flush_logs()
+    result = await _incremental_export(
+        "utm",
+        logs_collection,
+        {"action": "utm"},
+        "timestamp",
+        {"timestamp": 1, "details": 1},
+        _utm_row,
+        ["date", "user_id", "utm_data"],
+        mode,
+    )
+    logger.info("Exiting: export_utm_to_csv")
+    return result
+
+
+async def export_tickets_to_csv(mode: str = "full", season: Optional[str] = None) -> Dict[str, Any]:
+    logger.info("Entering: export_tickets_to_csv(mode={})", mode)
+    season = season or config.CURRENT_TICKET_SEASON
+
+    def to_row(user):
+        ticket_info = (user.get("tickets") or {}).get(season)
+        if not ticket_info:
+            return None
+        return {
             "season": season,
-            "date": created_at,
-            "user_id": user_id,
+            "date": _format_date(ticket_info.get("created_at")),
+            "user_id": user.get("UserID", "N/A"),
             "ticket_key": ticket_info.get("key", "N/A"),
             "ticket_uuid": ticket_info.get("uuid", "N/A"),
-        })
+        }
+
+    result = await _incremental_export(
+        f"tickets-{season}",
+        users_collection,
+        {f"tickets.{season}": {"$exists": True}},
+        f"tickets.{season}.created_at",
+        {
+            "UserID": 1,
+            f"tickets.{season}.created_at": 1,
+            f"tickets.{season}.key": 1,
+            f"tickets.{season}.uuid": 1,
+        },
+        to_row,
+        ["season", "date", "user_id", "ticket_key", "ticket_uuid"],
+        mode,
+    )
+    logger.info("Exiting: export_tickets_to_csv")
+    return result
 
-    await save_to_csv('data/output.csv', data, ["season", "date", "user_id", "ticket_key", "ticket_uuid"])
-    logger.info(f"Exiting: export_tickets_to_csv")
-    return data
 
+def segment_filter(
+    lang: Optional[str] = None,
+    utm: Optional[str] = None,
+    has_ticket: Optional[bool] = None,
+    dates: Iterable[str] = (),
+    scanned: Optional[bool] = None,
+    season: Optional[str] = None,
+    include_unreachable: bool = False,
+) -> Dict[str, Any]:
+    """Build the ``users`` query of a broadcast audience.
 
-async def get_user_ids(lang=None):
-    logger.info(f"Entering: get_user_ids(lang={lang})")
-    query = {}
+    Parameters
+    ----------
+    lang : str, optional
+        Exact ``Lang`` value, e.g. ``'ru'``.
+    utm : str, optional
+        ``utm`` tag the user came with.
+    has_ticket : bool, optional
+        Whether the user holds a ticket of ``season``.
+    dates : iterable of str
+        Event date ids (``date_27_11``) the user selected; all of them must be selected.
+        Implies ``has_ticket``.
+    scanned : bool, optional
+        Whether the ticket of ``season`` was scanned at the entrance. Implies ``has_ticket``.
+    season : str, optional
+        Defaults to ``config.CURRENT_TICKET_SEASON``.
+    include_unreachable : bool
+        Keep users who blocked the bot or were deactivated (see ``mark_unreachable``).
+    """
+    season = season or config.CURRENT_TICKET_SEASON
+    ticket = f"tickets.{season}"
+    query: Dict[str, Any] = {}
+    if not include_unreachable:
+        query["Unreachable.at"] = None  # matches a missing field, served by the "unreachable" index
     if lang:
-        if lang in ["ru", "en"]:
-            query = {"Lang": lang}
-    user_ids = await users_collection.distinct("UserID", query)
-    logger.info(f"Exiting: get_user_ids")
-    return user_ids
+        query["Lang"] = lang
+    if utm:
+        query["utm"] = utm
+    if has_ticket is not None:
+        query[ticket] = {"$exists": has_ticket}
+    for date_id in dates:
+        query[f"{ticket}.dates.{date_id}"] = True
+    if scanned is not None:
+        if scanned:
+            query[f"{ticket}.last_scanned_at"] = {"$ne": None}
+        else:
+            query[f"{ticket}.uuid"] = {"$exists": True}
+            query[f"{ticket}.last_scanned_at"] = None  # also matches a missing field
+    return query
+
+
+async def iter_segment_user_ids(
+    batch_size: int = 1000,
+    after_user_id: Optional[int] = None,
+    **segment,
+) -> AsyncIterator[int]:
+    """Stream ``UserID`` of the users matching ``segment_filter(**segment)``.
+
+    Unlike ``distinct`` the ids are read from a projected cursor batch by batch, so the
+    audience size is not bounded by the 16 MB reply limit and is never held in memory.
+    With ``after_user_id`` the ids come in ascending order starting after it, which lets
+    a caller resume an interrupted pass.
+    """
+    query = segment_filter(**segment)
+    if after_user_id is not None:
+        query["UserID"] = {"$gt": after_user_id}
+    cursor = users_collection.find(query, {"UserID": 1, "_id": 0}).batch_size(batch_size)
+    if after_user_id is not None:
+        cursor = cursor.sort("UserID", ASCENDING)
+    logger.info("Entering: iter_segment_user_ids(query={})", query)
+    sent = 0
+    async for user in cursor:
+        user_id = user.get("UserID")
+        if user_id is not None:
+            sent += 1
+            yield user_id
+    logger.info("Exiting: iter_segment_user_ids ({} users)", sent)
+
+
+async def count_segment(**segment) -> int:
+    return await users_collection.count_documents(segment_filter(**segment))
+
+
+@retry_transient
+async def mark_unreachable(user_id: int, reason: str):
+    logger.info("Entering: mark_unreachable(user_id={}, reason={})", user_id, reason)
+    await users_collection.update_one(
+        {"UserID": user_id},
+        {"$set": {"Unreachable": {"reason": reason, "at": datetime.utcnow()}}},
+    )
+    logger.info("Exiting: mark_unreachable")
+
 
+@retry_transient
+async def clear_unreachable(user_id: int):
+    logger.info("Entering: clear_unreachable(user_id={})", user_id)
+    await users_collection.update_one(
+        {"UserID": user_id, "Unreachable": {"$exists": True}},
+        {"$unset": {"Unreachable": ""}},
+    )
+    logger.info("Exiting: clear_unreachable")
+
+
+async def iter_unreachable_user_ids(marked_before: datetime, limit: int = 0) -> AsyncIterator[int]:
+    """Stream users marked unreachable before ``marked_before``, oldest mark first."""
+    cursor = users_collection.find(
+        {"Unreachable.at": {"$lt": marked_before}},
+        {"UserID": 1, "_id": 0},
+    ).sort("Unreachable.at", ASCENDING).limit(limit)
+    async for user in cursor:
+        yield user["UserID"]
+
+
+async def count_unreachable() -> Dict[str, int]:
+    counts = {}
+    async for row in users_collection.aggregate([
+        {"$match": {"Unreachable.at": {"$ne": None}}},
+        {"$group": {"_id": "$Unreachable.reason", "count": {"$sum": 1}}},
+    ]):
+        counts[row["_id"]] = row["count"]
+    return counts
+
+
+async def schedule_job(key: str, kind: str, run_at: datetime, payload: Dict[str, Any]) -> bool:
+    """Queue a job unless one with ``key`` is pending or running. Returns whether it was queued.
+
+    A job with the same ``key`` that is done, cancelled or failed is replaced by the new one.
+    """
+    logger.info("Entering: schedule_job(key={}, kind={}, run_at={})", key, kind, run_at)
+    job = {
+        "key": key,
+        "kind": kind,
+        "run_at": run_at,
+        "status": "pending",
+        "payload": payload,
+        "cursor": None,
+        "stats": {},
+        "failures": 0,
+        "created_at": datetime.utcnow(),
+    }
+    result = await jobs_collection.update_one(
+        {"key": key, "status": {"$in": ["done", "cancelled", "failed"]}},
+        {"$set": job, "$unset": {"finished_at": "", "lease_until": ""}},
+    )
+    created = result.modified_count > 0
+    if not created:
+        result = await jobs_collection.update_one({"key": key}, {"$setOnInsert": job}, upsert=True)
+        created = result.upserted_id is not None
+    logger.info("Exiting: schedule_job(created={})", created)
+    return created
+
+
+async def claim_due_job(lease_seconds: float) -> Optional[Dict[str, Any]]:
+    """Take the oldest due job, or one whose runner stopped renewing its lease."""
+    now = datetime.utcnow()
+    return await jobs_collection.find_one_and_update(
+        {
+            "status": {"$in": ["pending", "running"]},
+            "run_at": {"$lte": now},
+            "$or": [{"lease_until": {"$exists": False}}, {"lease_until": {"$lt": now}}],
+        },
+        {"$set": {"status": "running", "lease_until": now + timedelta(seconds=lease_seconds)}},
+        sort=[("run_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def advance_job(key: str, cursor: int, outcome: str, lease_seconds: float):
+    """Record one handled recipient and extend the lease."""
+    await jobs_collection.update_one(
+        {"key": key},
+        {
+            "$set": {"cursor": cursor, "lease_until": datetime.utcnow() + timedelta(seconds=lease_seconds)},
+            "$inc": {f"stats.{outcome}": 1},
+        },
+    )
+
+
+async def record_job_failure(key: str) -> int:
+    """Count a run of the job that raised; returns the failures so far."""
+    job = await jobs_collection.find_one_and_update(
+        {"key": key},
+        {"$inc": {"failures": 1}},
+        projection={"failures": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    return job["failures"] if job else 0
+
+
+async def finish_job(key: str, status: str = "done"):
+    logger.info("Entering: finish_job(key={}, status={})", key, status)
+    await jobs_collection.update_one(
+        # a job cancelled while running keeps its status
+        {"key": key, "status": {"$in": ["pending", "running"]}},
+        {"$set": {"status": status, "finished_at": datetime.utcnow()}, "$unset": {"lease_until": ""}},
+    )
+    logger.info("Exiting: finish_job")
+
+
+async def release_job(key: str):
+    """Give up the lease of a running job so another runner can resume it right away."""
+    await jobs_collection.update_one({"key": key, "status": "running"}, {"$unset": {"lease_until": ""}})
+
+
+async def cancel_job(key: str) -> bool:
+    result = await jobs_collection.update_one(
+        {"key": key, "status": {"$in": ["pending", "running"]}},
+        {"$set": {"status": "cancelled", "finished_at": datetime.utcnow()}},
+    )
+    return result.modified_count > 0
+
+
+async def get_job_status(key: str) -> Optional[str]:
+    job = await jobs_collection.find_one({"key": key}, {"status": 1})
+    return job["status"] if job else None
+
+
+async def list_jobs(limit: int = 20) -> List[Dict[str, Any]]:
+    return await jobs_collection.find({}, {"payload": 0}).sort("run_at", -1).limit(limit).to_list(length=limit)
+
+
+@retry_transient
 async def add_admin_id(admin_id: int):
-    logger.info(f"Entering: add_admin_id(admin_id={admin_id})")
+    logger.info("Entering: add_admin_id(admin_id={})", admin_id)
     """Добавляет новый admin_id в массив Admins в коллекции config"""
     await config_collection.update_one(
         {"Key": "Admins"},
         {"$addToSet": {"Value": admin_id}},
         upsert=True
     )
-    logger.info(f"Exiting: add_admin_id")
+    logger.info("Exiting: add_admin_id")
 
 
+@retry_transient
 async def get_admins_list():
-    logger.info(f"Entering: get_admins_list")
+    logger.info("Entering: get_admins_list")
     """Получает весь список admin_id из массива Admins в коллекции config"""
     config_entry = await config_collection.find_one({"Key": "Admins"})
     if config_entry and "Value" in config_entry:
-        logger.info(f"Exiting: get_admins_list")
+        logger.info("Exiting: get_admins_list")
         return config_entry["Value"]
-    logger.info(f"Exiting: get_admins_list (no admins found)")
+    logger.info("Exiting: get_admins_list (no admins found)")
     return []
 
 
 async def add_scan_log(admin_id: int, user_id: int):
-    logger.info(f"Entering: add_scan_log(admin_id={admin_id}, user_id={user_id})")
+    logger.info("Entering: add_scan_log(admin_id={}, user_id={})", admin_id, user_id)
     """Добавляет запись в массив ScanLog в коллекции config
     со значениями: ID пользователя, ID билета и текущей датой"""
     log_entry = {
@@ -352,10 +1220,18 @@ async def add_scan_log(admin_id: int, user_id: int):
         {"$push": {"Value": log_entry}},
         upsert=True
     )
-    logger.info(f"Exiting: add_scan_log")
+    logger.info("Exiting: add_scan_log")
+
+
+async def _run_migration():
+    from database.connection import open_mongo, close_mongo
+    await open_mongo()
+    try:
+        return await migrate_ticket_fields_to_season(remove_original_fields=True)
+    finally:
+        await close_mongo()
 
 
 if __name__ == '__main__':
-    # print(asyncio.run(get_user_data(0, "ab280e7b8d3e4e0ea3f5351f6408336e")))
-    _ = asyncio.run(migrate_ticket_fields_to_season(remove_original_fields=True))
+    _ = asyncio.run(_run_migration())
     print(len(_), _)
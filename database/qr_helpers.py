@@ -1,19 +1,34 @@
-import qrcode
-from PIL import ImageDraw, Image, ImageFont
-import cv2  # opencv-python
-from pyzbar.pyzbar import decode
-from PIL import Image
+# qrcode, PIL, cv2 and pyzbar are imported inside the functions that use them:
+# they are slow to load and only needed once the first ticket is drawn or scanned.
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 from loguru import logger
 
+from config.bot_config import config
+
+# Drawing and decoding are CPU bound; they run here instead of on the event loop.
+_image_executor = ThreadPoolExecutor(max_workers=config.IMAGE_WORKERS, thread_name_prefix="image")
+
+
+async def run_image_task(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_image_executor, partial(func, *args, **kwargs))
+
+
 def decode_color(color):
-    logger.info(f"Entering: decode_color(color={color})")
+    logger.info("Entering: decode_color(color={})", color)
     result = tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
-    logger.info(f"Exiting: decode_color")
+    logger.info("Exiting: decode_color")
     return result
 
 
 def create_qr_with_logo(qr_code_text, logo_img):
-    logger.info(f"Entering: create_qr_with_logo")
+    logger.info("Entering: create_qr_with_logo")
+    import qrcode
+
     # Создание QR-кода
     qr = qrcode.QRCode(
         version=5,
@@ -29,12 +44,14 @@ def create_qr_with_logo(qr_code_text, logo_img):
     pos = ((qr_code_img.size[0] - logo_img.size[0]) // 2 + 5, (qr_code_img.size[1] - logo_img.size[1]) // 2)
     qr_code_img.paste(logo_img, pos)
 
-    logger.info(f"Exiting: create_qr_with_logo")
+    logger.info("Exiting: create_qr_with_logo")
     return qr_code_img
 
 
 def create_image_with_text(text, font_path='DejaVuSansMono.ttf', font_size=30, image_size=(200, 50)):
-    logger.info(f"Entering: create_image_with_text(text={text})")
+    logger.info("Entering: create_image_with_text(text={})", text)
+    from PIL import Image, ImageDraw, ImageFont
+
     # Создание пустого изображения
     image = Image.new('RGB', image_size, color='white')
     draw = ImageDraw.Draw(image)
@@ -57,64 +74,63 @@ def create_image_with_text(text, font_path='DejaVuSansMono.ttf', font_size=30, i
     xy = [0, 0, image_size[0] - 1, image_size[1] - 1]
     draw.rectangle(xy, outline=decode_color('C1D9F9'), width=2)
 
-    logger.info(f"Exiting: create_image_with_text")
+    logger.info("Exiting: create_image_with_text")
     return image
 
 
-def create_beautiful_code(file_name, address, text=''):
-    logger.info(f"Entering: create_beautiful_code(file_name={file_name}, address={address}, text={text})")
+def render_beautiful_code(address, text='') -> bytes:
+    logger.info("Entering: render_beautiful_code(address={}, text={})", address, text)
     logo_img = create_image_with_text(text)
     qr_with_logo_img = create_qr_with_logo(address, logo_img)
-    qr_with_logo_img.save(file_name)
-    logger.info(f"Exiting: create_beautiful_code")
-
+    buffer = io.BytesIO()
+    qr_with_logo_img.save(buffer, format='PNG')
+    logger.info("Exiting: render_beautiful_code")
+    return buffer.getvalue()
 
-def decode_qr_code_cv(image_path):
-    logger.info(f"Entering: decode_qr_code_cv(image_path={image_path})")
-    image = cv2.imread(image_path)
-    if image is None:
-        logger.error(f"Could not read image from {image_path}")
-        return None
-    qr_code_detector = cv2.QRCodeDetector()
-    decoded_text, points, _ = qr_code_detector.detectAndDecode(image)
-
-    if points is not None and decoded_text:
-        logger.info(f"Exiting: decode_qr_code_cv with decoded_text")
-        return decoded_text
-    else:
-        logger.info(f"Exiting: decode_qr_code_cv (no QR code found)")
-        return None
 
+def create_beautiful_code(file_name, address, text=''):
+    logger.info("Entering: create_beautiful_code(file_name={}, address={}, text={})",
+                file_name, address, text)
+    with open(file_name, 'wb') as file:
+        file.write(render_beautiful_code(address, text))
+    logger.info("Exiting: create_beautiful_code")
+
+
+def decode_qr_bytes(data: bytes):
+    """Decode a QR code from an encoded image held in memory (a downloaded photo)."""
+    logger.info("Entering: decode_qr_bytes(size={})", len(data))
+    import cv2  # opencv-python
+    import numpy as np
+
+    result = None
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is not None:
+        decoded_text, points, _ = cv2.QRCodeDetector().detectAndDecode(image)
+        if points is not None and decoded_text:
+            result = decoded_text
+    if result is None:
+        from PIL import Image, UnidentifiedImageError
+        from pyzbar.pyzbar import decode
 
-def decode_qr_code_pyzbar(image_path):
-    logger.info(f"Entering: decode_qr_code_pyzbar(image_path={image_path})")
-    try:
-        image = Image.open(image_path)
-        decoded_objects = decode(image)
+        try:
+            decoded_objects = decode(Image.open(io.BytesIO(data)))
+        except UnidentifiedImageError:
+            decoded_objects = []
         if decoded_objects:
             result = decoded_objects[0].data.decode('utf-8')
-            logger.info(f"Exiting: decode_qr_code_pyzbar with result")
-            return result
-        else:
-            logger.info(f"Exiting: decode_qr_code_pyzbar (no QR code found)")
-            return None
-    except FileNotFoundError:
-        logger.error(f"Image file not found at {image_path}")
-        return None
-
-def decode_qr_code(image_path):
-    logger.info(f"Entering: decode_qr_code(image_path={image_path})")
-    result = decode_qr_code_cv(image_path)
+    logger.info("Exiting: decode_qr_bytes ({})", 'decoded' if result else 'no QR code found')
+    return result
 
-    if result is None:
-        result = decode_qr_code_pyzbar(image_path)
 
-    if result is None:
-        logger.info(f"Exiting: decode_qr_code (no QR code found)")
+def decode_qr_code(image_path):
+    """Decode a QR code from an image file with ``decode_qr_bytes``."""
+    try:
+        with open(image_path, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        logger.error("Image file not found at {}", image_path)
         return None
-    else:
-        logger.info(f"Exiting: decode_qr_code with result")
-        return result
+    return decode_qr_bytes(data)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,104 @@
+"""Compact typed records returned by projected ``users`` queries.
+
+The hot handlers only need the language and the current season's ticket, so
+instead of passing whole Mongo documents around the data access layer maps the
+projected fields onto ``__slots__`` classes. They carry no per-instance
+``__dict__`` and keep the attribute set explicit. ``parse_ticket_key`` turns
+a key typed at the gate into the form stored in ``SeasonTicket.key``.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Mapping, Optional
+
+
+def parse_ticket_key(text: str) -> Optional[str]:
+    """Turn a typed ``MTLFEST011``/``011``/``11`` into the stored key ``"011"``."""
+    text = text.strip().upper()
+    if text.startswith("MTLFEST"):
+        text = text[len("MTLFEST"):].strip()
+    if not text.isdigit():
+        return None
+    return f"{int(text):03d}"
+
+
+class SeasonTicket:
+    """Ticket issued to a user for a single season (``tickets.<season>``)."""
+
+    __slots__ = ("season", "uuid", "key", "created_at", "last_scanned_at", "dates")
+
+    def __init__(
+        self,
+        season: str,
+        uuid: Optional[str] = None,
+        key: Optional[str] = None,
+        created_at: Optional[datetime] = None,
+        last_scanned_at: Optional[datetime] = None,
+        dates: Optional[Dict[str, bool]] = None,
+    ):
+        self.season = season
+        self.uuid = uuid
+        self.key = key
+        self.created_at = created_at
+        self.last_scanned_at = last_scanned_at
+        self.dates = dates or {}
+
+    @classmethod
+    def from_document(cls, season: str, document: Optional[Mapping[str, Any]]) -> Optional["SeasonTicket"]:
+        """Build a ticket from a ``users`` document, ``None`` if the season is absent."""
+        tickets = document.get("tickets") if document else None
+        if not isinstance(tickets, dict):
+            return None
+        return cls.from_entry(season, tickets.get(season))
+
+    @classmethod
+    def from_entry(cls, season: str, info: Optional[Mapping[str, Any]]) -> Optional["SeasonTicket"]:
+        """Build a ticket from a bare ``tickets.<season>`` entry."""
+        if not isinstance(info, dict) or not info:
+            return None
+        dates = info.get("dates")
+        return cls(
+            season,
+            uuid=info.get("uuid"),
+            key=info.get("key"),
+            created_at=info.get("created_at"),
+            last_scanned_at=info.get("last_scanned_at"),
+            dates=dates if isinstance(dates, dict) else None,
+        )
+
+    def is_date_selected(self, date_id: str) -> bool:
+        return bool(self.dates.get(date_id, False))
+
+    def __repr__(self) -> str:
+        return f"SeasonTicket(season={self.season!r}, uuid={self.uuid!r}, key={self.key!r})"
+
+
+class UserProfile:
+    """Projection of a ``users`` document with the fields the dialogs need."""
+
+    __slots__ = ("user_id", "lang", "ticket")
+
+    def __init__(self, user_id: int, lang: Optional[str] = None, ticket: Optional[SeasonTicket] = None):
+        self.user_id = user_id
+        self.lang = lang
+        self.ticket = ticket
+
+    @classmethod
+    def from_document(cls, document: Optional[Mapping[str, Any]], season: str) -> Optional["UserProfile"]:
+        if not document:
+            return None
+        return cls(
+            document.get("UserID"),
+            lang=document.get("Lang"),
+            ticket=SeasonTicket.from_document(season, document),
+        )
+
+    @property
+    def ticket_uuid(self) -> Optional[str]:
+        return self.ticket.uuid if self.ticket else None
+
+    @property
+    def ticket_key(self) -> Optional[str]:
+        return self.ticket.key if self.ticket else None
+
+    def __repr__(self) -> str:
+        return f"UserProfile(user_id={self.user_id!r}, lang={self.lang!r}, ticket={self.ticket!r})"
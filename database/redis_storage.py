@@ -0,0 +1,189 @@
+"""Redis FSM storage with per-kind TTLs and a compact serializer.
+
+aiogram keeps three kinds of records per user: the FSM state, the FSM data
+(``lang`` and friends) and, through aiogram_dialog, a dialog stack plus one
+context per opened dialog. Without expiry every user who ever pressed /start
+keeps all of them forever, so each kind gets its own TTL from ``Config``
+(refreshed on every write). Data records are packed with msgpack when it is
+installed; values written as JSON by older versions are still readable.
+
+``redis_key_report`` and ``sweep_redis_keys`` back the admin commands that show
+key counts and memory by kind and put a TTL on records written before this
+storage was introduced.
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+from loguru import logger
+
+from config.bot_config import config
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+KEY_KINDS = ("state", "data", "dialog_stack", "dialog_context", "lock", "other")
+
+
+def _ttl(seconds: int) -> Optional[int]:
+    return seconds if seconds and seconds > 0 else None
+
+
+def key_kind(redis_key: str) -> str:
+    """Classify a storage key built by ``DefaultKeyBuilder(with_destiny=True)``."""
+    if not redis_key.startswith("fsm:"):
+        return "other"
+    if redis_key.endswith(":lock"):
+        return "lock"
+    if redis_key.endswith(":state"):
+        return "state"
+    if redis_key.endswith(":data"):
+        if ":aiogd:stack:" in redis_key:
+            return "dialog_stack"
+        if ":aiogd:context:" in redis_key:
+            return "dialog_context"
+        return "data"
+    return "other"
+
+
+def kind_ttls() -> Dict[str, Optional[int]]:
+    return {
+        "state": _ttl(config.FSM_STATE_TTL),
+        "data": _ttl(config.FSM_DATA_TTL),
+        "dialog_stack": _ttl(config.DIALOG_STACK_TTL),
+        "dialog_context": _ttl(config.DIALOG_CONTEXT_TTL),
+    }
+
+
+class CompactRedisStorage(RedisStorage):
+    def __init__(self, *args: Any, use_msgpack: bool = True, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.use_msgpack = use_msgpack and msgpack is not None
+        if use_msgpack and msgpack is None:
+            logger.warning("msgpack is not installed, FSM data is stored as JSON")
+        self.ttls = kind_ttls()
+
+    def _data_ttl(self, key: StorageKey) -> Optional[int]:
+        if key.destiny.startswith("aiogd:stack"):
+            return self.ttls["dialog_stack"]
+        if key.destiny.startswith("aiogd:context"):
+            return self.ttls["dialog_context"]
+        return self.ttls["data"]
+
+    def _dumps(self, data: Dict[str, Any]):
+        if self.use_msgpack:
+            return msgpack.packb(data, use_bin_type=True)
+        return self.json_dumps(data)
+
+    def _loads(self, value) -> Dict[str, Any]:
+        if isinstance(value, bytes):
+            if msgpack is not None:
+                try:
+                    return msgpack.unpackb(value, raw=False, strict_map_key=False)
+                except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError):
+                    pass  # written as JSON before the switch
+            value = value.decode("utf-8")
+        return self.json_loads(value)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        redis_key = self.key_builder.build(key, "state")
+        if state is None:
+            await self.redis.delete(redis_key)
+        else:
+            await self.redis.set(
+                redis_key,
+                state.state if isinstance(state, State) else state,
+                ex=self.ttls["state"],
+            )
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        redis_key = self.key_builder.build(key, "data")
+        if not data:
+            await self.redis.delete(redis_key)
+            return
+        await self.redis.set(redis_key, self._dumps(data), ex=self._data_ttl(key))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        redis_key = self.key_builder.build(key, "data")
+        value = await self.redis.get(redis_key)
+        if value is None:
+            return {}
+        return self._loads(value)
+
+
+def create_storage() -> CompactRedisStorage:
+    return CompactRedisStorage.from_url(
+        url=config.REDIS_URL,
+        key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+        use_msgpack=config.FSM_SERIALIZER == "msgpack",
+    )
+
+
+async def redis_key_report(redis, batch_size: int = 500) -> Dict[str, Dict[str, int]]:
+    """Count keys, keys without TTL and memory (bytes) per key kind using SCAN."""
+    logger.info("Entering: redis_key_report")
+    report: Dict[str, Dict[str, int]] = defaultdict(lambda: {"keys": 0, "no_ttl": 0, "bytes": 0})
+    batch = []
+
+    async def flush():
+        pipe = redis.pipeline(transaction=False)
+        for redis_key in batch:
+            pipe.ttl(redis_key)
+            pipe.memory_usage(redis_key)
+        # MEMORY USAGE may be disabled on managed servers; count such keys with 0 bytes
+        results = await pipe.execute(raise_on_error=False)
+        for index, redis_key in enumerate(batch):
+            ttl, size = results[2 * index], results[2 * index + 1]
+            entry = report[key_kind(redis_key)]
+            entry["keys"] += 1
+            entry["bytes"] += size if isinstance(size, int) else 0
+            if ttl == -1:
+                entry["no_ttl"] += 1
+        batch.clear()
+
+    async for raw_key in redis.scan_iter(count=batch_size):
+        batch.append(raw_key.decode() if isinstance(raw_key, bytes) else raw_key)
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    logger.info("Exiting: redis_key_report")
+    return dict(report)
+
+
+async def sweep_redis_keys(redis, batch_size: int = 500) -> Dict[str, int]:
+    """Set the configured TTL on storage keys that have none. Returns keys updated per kind."""
+    logger.info("Entering: sweep_redis_keys")
+    ttls = kind_ttls()
+    updated: Dict[str, int] = defaultdict(int)
+    batch = []
+
+    async def flush():
+        pipe = redis.pipeline(transaction=False)
+        for redis_key in batch:
+            pipe.ttl(redis_key)
+        results = await pipe.execute()
+        pipe = redis.pipeline(transaction=False)
+        for redis_key, ttl in zip(batch, results):
+            # -1: no expiry; active users already carry a refreshed TTL and are left alone
+            if ttl == -1:
+                pipe.expire(redis_key, ttls[key_kind(redis_key)])
+                updated[key_kind(redis_key)] += 1
+        await pipe.execute()
+        batch.clear()
+
+    async for raw_key in redis.scan_iter(match="fsm:*", count=batch_size):
+        redis_key = raw_key.decode() if isinstance(raw_key, bytes) else raw_key
+        if ttls.get(key_kind(redis_key)):
+            batch.append(redis_key)
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    logger.info("Exiting: sweep_redis_keys ({})", dict(updated))
+    return dict(updated)
@@ -4,8 +4,7 @@ SERVICE_FILE="mtlfest_bot.service"
 
 # Перезапуск службы
 echo "Перезапуск службы..."
-sudo systemctl stop $SERVICE_FILE
-sudo systemctl start $SERVICE_FILE
+sudo systemctl restart $SERVICE_FILE
 
 # Проверка статуса службы
 echo "Проверка статуса службы..."
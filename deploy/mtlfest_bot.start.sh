@@ -3,6 +3,8 @@
 cd /home/mtlfest_bot/
 source /home/mtlfest_bot/.venv/bin/activate
 export ENVIRONMENT=production
+# everything goes to mtlfest_bot.log; keep service.err.log for warnings and errors
+export LOG_STDERR_LEVEL=WARNING
 python3 main.py mtlfest_bot
 
 deactivate
@@ -1,19 +1,58 @@
+import time
+
+_process_started = time.perf_counter()
+
 import asyncio
-from contextlib import suppress
+from contextlib import contextmanager, suppress
+from typing import Dict, List
 
 import sentry_sdk
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.exceptions import TelegramBadRequest
-from aiogram.fsm.storage.base import DefaultKeyBuilder
-from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.types import BotCommand, BotCommandScopeChat, BotCommandScopeDefault, BotCommandScopeAllPrivateChats
 from aiogram_dialog.setup import setup_dialogs
 from loguru import logger
 
-from config.bot_config import config
-from database.database import get_admins_list
+from config.bot_config import config, current_festival, festival_for_bot, festivals, run_in_festival
+from config.logging_setup import setup_logging
+from database.connection import open_mongo, close_mongo
+from database.database import get_admins_list, ensure_indexes, ensure_counters, flush_logs, log_flush_loop
+from database.redis_storage import create_storage
+from middlewares.festival import FestivalMiddleware
+from middlewares.scheduler import SchedulerMiddleware
+from middlewares.throttling import ThrottlingMiddleware
+from middlewares.update_logging import UpdateLoggingMiddleware
 from routers import admin, main_dialog
+from services.broadcast import reprobe_loop
+from services.health import HealthMonitor
+from services.jobs import JobRunner
+from services.profiling import memprofile_loop, start_tracing
+from services.telegram_api import create_session
+
+# Seconds spent in each startup phase, filled in as the bot boots.
+startup_timings: Dict[str, float] = {"imports": time.perf_counter() - _process_started}
+
+
+@contextmanager
+def startup_phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - started
+
+
+async def _timed(name: str, awaitable):
+    with startup_phase(name):
+        return await awaitable
+
+
+def startup_report() -> str:
+    total = time.perf_counter() - _process_started
+    phases = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in startup_timings.items())
+    return f"Startup took {total:.3f}s ({phases})"
 
 
 async def set_commands(bot: Bot):
@@ -41,42 +80,140 @@ async def set_commands(bot: Bot):
         )
     ]
 
-    await bot.set_my_commands(commands=commands_clear, scope=BotCommandScopeDefault())
-    await bot.set_my_commands(commands=commands_private, scope=BotCommandScopeAllPrivateChats())
-    await bot.set_my_commands(commands=commands_private_ru, scope=BotCommandScopeAllPrivateChats(), language_code='ru')
-    await bot.set_my_commands(commands=commands_private_me, scope=BotCommandScopeChat(chat_id=84131737))
+    await asyncio.gather(
+        bot.set_my_commands(commands=commands_clear, scope=BotCommandScopeDefault()),
+        bot.set_my_commands(commands=commands_private, scope=BotCommandScopeAllPrivateChats()),
+        bot.set_my_commands(commands=commands_private_ru, scope=BotCommandScopeAllPrivateChats(), language_code='ru'),
+        _set_chat_commands(bot, commands_private_me, 84131737),
+    )
+
+
+async def _set_chat_commands(bot: Bot, commands, chat_id: int):
+    # a side bot the chat has never opened answers "chat not found"
+    with suppress(TelegramBadRequest):
+        await bot.set_my_commands(commands=commands, scope=BotCommandScopeChat(chat_id=chat_id))
+
 
+async def start_festival(bot: Bot) -> List[asyncio.Task]:
+    """Prepare the database of the current festival and start its background tasks.
 
-async def on_startup(bot: Bot, dispatcher: Dispatcher):
-    await set_commands(bot)
-    config.admins = await get_admins_list()
+    Runs with the festival of ``bot`` current, so the tasks created here keep it.
+    """
+    festival = current_festival.get()
+    # phases of the main bot keep their plain names in the startup report
+    suffix = "" if festival is festivals[0] else f":{festival.name}"
+    # The commands, indexes and admin list do not depend on each other.
+    _, _, festival.admins, _ = await asyncio.gather(
+        _timed(f"set_commands{suffix}", set_commands(bot)),
+        _timed(f"ensure_indexes{suffix}", ensure_indexes()),
+        _timed(f"load_admins{suffix}", get_admins_list()),
+        _timed(f"ensure_counters{suffix}", ensure_counters()),
+    )
+    return [
+        asyncio.create_task(reprobe_loop(bot)),
+        asyncio.create_task(JobRunner(bot).run_forever()),
+        asyncio.create_task(log_flush_loop()),
+    ]
+
+
+async def on_startup(bots: List[Bot], dispatcher: Dispatcher):
+    main_bot = bots[0]
+    await _timed("mongo", open_mongo())
+    # one Mongo client, Redis storage and image worker pool for all bots
+    background_tasks = []
+    started = await asyncio.gather(*(run_in_festival(festival_for_bot(bot.id), start_festival(bot)) for bot in bots))
+    for tasks in started:
+        background_tasks.extend(tasks)
+    if config.MEMPROFILE_INTERVAL_HOURS > 0:
+        background_tasks.append(asyncio.create_task(memprofile_loop()))
+    elif config.MEMPROFILE_TRACE:
+        start_tracing()
+    dispatcher["background_tasks"] = background_tasks
+    dispatcher["health"] = HealthMonitor(main_bot, dispatcher.storage, dispatcher["update_scheduler"])
+    await _timed("health", dispatcher["health"].start())
+    report = startup_report()
+    if len(bots) > 1:
+        report += "\nFestivals: " + ", ".join(repr(festival_for_bot(bot.id)) for bot in bots)
+    logger.info(report)
     with suppress(TelegramBadRequest):
-        await bot.send_message(chat_id=84131737, text='Bot started')
+        await main_bot.send_message(chat_id=84131737, text=f'Bot started\n{report}')
     if config.TEST_MODE:
         logger.info("Test mode")
 
 
-async def main():
-    storage = RedisStorage.from_url(url=config.REDIS_URL,
-                                    key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True))
-    bot = Bot(token=config.BOT_TOKEN, default=DefaultBotProperties(parse_mode='HTML'))
-    config.bot = bot
+async def drain_updates(update_scheduler: SchedulerMiddleware, timeout: float) -> int:
+    """Wait until no handler is running or ``timeout`` passes. Returns handlers still running."""
+    deadline = time.perf_counter() + timeout
+    while update_scheduler.in_flight and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    return update_scheduler.in_flight
+
+
+async def on_shutdown(bots: List[Bot], dispatcher: Dispatcher):
+    # Polling has stopped by now (SIGTERM from systemd or /restart), but handlers of updates
+    # already received keep running as tasks: let them finish before closing Mongo.
+    started = time.perf_counter()
+    health = dispatcher.workflow_data.pop("health", None)
+    if health is not None:
+        health.draining = True
+    in_flight = dispatcher["update_scheduler"].in_flight
+    left = await drain_updates(dispatcher["update_scheduler"], config.DRAIN_TIMEOUT)
+    for task in dispatcher.workflow_data.pop("background_tasks", []):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    if health is not None:
+        await health.stop()
+    flushed = 0
+    for festival in festivals:
+        flushed += await run_in_festival(festival, flush_logs())
+    report = (f"Drained {in_flight - left}/{in_flight} handlers, flushed {flushed} log entries "
+              f"in {time.perf_counter() - started:.3f}s" + (f", {left} cut off" if left else ""))
+    logger.info(report)
+    with suppress(Exception):
+        await bots[0].send_message(chat_id=84131737, text=f'Bot stopping\n{report}')
+    await close_mongo()
+
+
+def create_dispatcher(storage: BaseStorage) -> Dispatcher:
     dp = Dispatcher(storage=storage)
     dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    dp.update.outer_middleware(FestivalMiddleware())
+    dp.update.outer_middleware(UpdateLoggingMiddleware())
+    dp.update.outer_middleware(ThrottlingMiddleware())
+    update_scheduler = SchedulerMiddleware()
+    dp.update.outer_middleware(update_scheduler)
+    dp["update_scheduler"] = update_scheduler
 
     dp.include_router(admin.router)
     dp.include_router(main_dialog.dialog)
 
     setup_dialogs(dp)
+    return dp
+
+
+async def main():
+    with startup_phase("setup"):
+        storage = create_storage()
+        # the bots share one API session (and its connection pool)
+        session = create_session()
+        bots = [
+            Bot(token=festival.token, session=session, default=DefaultBotProperties(parse_mode='HTML'))
+            for festival in festivals
+        ]
+        config.bot = bots[0]
+        dp = create_dispatcher(storage)
 
     try:
-        await dp.start_polling(bot)
+        await dp.start_polling(*bots)
     finally:
-        await bot.session.close()
+        await session.close()
+        await logger.complete()
 
 
 if __name__ == '__main__':
-    logger.add("mtlfest_bot.log", rotation="1 MB", level='INFO')
+    setup_logging()
     sentry_sdk.init(
         dsn=config.SENTRY_DSN,
         traces_sample_rate=1.0,
@@ -0,0 +1,32 @@
+"""Selects the festival of the bot an update came to.
+
+In multi-bot mode one dispatcher serves several tokens. This outermost
+middleware makes the festival of ``data["bot"]`` current for the whole
+handling of the update, so ``config.CURRENT_TICKET_SEASON``, ``config.admins``
+and the collections of ``database.database`` resolve to that bot's season and
+database, and log records carry its name.
+"""
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from loguru import logger
+
+from config.bot_config import current_festival, festival_for_bot
+
+
+class FestivalMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        festival = festival_for_bot(data["bot"].id)
+        token = current_festival.set(festival)
+        try:
+            with logger.contextualize(festival=festival.name):
+                return await handler(event, data)
+        finally:
+            current_festival.reset(token)
@@ -0,0 +1,173 @@
+"""Bounded, priority-aware scheduling of update handlers.
+
+``start_polling`` runs every update as its own task, so a burst of ordinary
+users competes equally with gate admins scanning tickets. This outer
+middleware lets at most ``SCHEDULER_MAX_CONCURRENCY`` handlers run at once
+and hands free slots out by priority class: admin scans (QR photos and typed
+ticket keys) first, then ticket issuance and the questionnaire, then
+everything else. Updates of one user are serialized in arrival order, and
+queue depth and wait time are tracked per class.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, User
+
+from config.bot_config import config
+from database.records import parse_ticket_key
+
+PRIORITY_SCAN = 0
+PRIORITY_TICKET = 1
+PRIORITY_STATIC = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_SCAN: "scan",
+    PRIORITY_TICKET: "ticket",
+    PRIORITY_STATIC: "static",
+}
+
+# Widgets of the registration flow in routers.main_dialog
+_TICKET_WIDGETS = ("ticket_", "date_", "confirm_dates")
+
+
+def classify_update(update: Update, user: Optional[User]) -> int:
+    message = update.message
+    if message is not None:
+        if user is not None and user.id in config.admins:
+            # a QR photo or a ticket key typed at the gate when the code does not scan
+            if message.photo or (message.text and parse_ticket_key(message.text)):
+                return PRIORITY_SCAN
+        if message.text and not message.text.startswith("/"):
+            # free-text answers of the questionnaire
+            return PRIORITY_TICKET
+        return PRIORITY_STATIC
+    callback = update.callback_query
+    if callback is not None and callback.data:
+        # aiogram_dialog prefixes widget ids with "<intent id>\x1d"
+        widget = callback.data.split("\x1d", 1)[-1]
+        if widget.startswith(_TICKET_WIDGETS):
+            return PRIORITY_TICKET
+    return PRIORITY_STATIC
+
+
+class PriorityLimiter:
+    """Semaphore whose waiters are woken lowest priority value first, FIFO within a class."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    async def acquire(self, priority: int):
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self.waiting += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self.waiting -= 1
+            else:
+                # the slot was handed over right before cancellation
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.waiting -= 1
+                future.set_result(None)  # the slot passes straight to the waiter
+                return
+        self.active -= 1
+
+
+class _ClassStats:
+    __slots__ = ("waiting", "running", "handled", "wait_total", "wait_max")
+
+    def __init__(self):
+        self.waiting = 0
+        self.running = 0
+        self.handled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class SchedulerMiddleware(BaseMiddleware):
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.limiter = PriorityLimiter(max_concurrency or config.SCHEDULER_MAX_CONCURRENCY)
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_pending: Dict[int, int] = {}
+        self._stats = {priority: _ClassStats() for priority in PRIORITY_NAMES}
+        self.in_flight = 0
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for priority, stats in self._stats.items():
+            result[PRIORITY_NAMES[priority]] = {
+                "waiting": stats.waiting,
+                "running": stats.running,
+                "handled": stats.handled,
+                "avg_wait_ms": stats.wait_total / stats.handled * 1000 if stats.handled else 0.0,
+                "max_wait_ms": stats.wait_max * 1000,
+            }
+        return result
+
+    async def _run(self, priority: int, handler, event, data):
+        stats = self._stats[priority]
+        stats.waiting += 1
+        queued = time.perf_counter()
+        try:
+            await self.limiter.acquire(priority)
+        finally:
+            stats.waiting -= 1
+        waited = time.perf_counter() - queued
+        stats.wait_total += waited
+        stats.wait_max = max(stats.wait_max, waited)
+        stats.running += 1
+        try:
+            return await handler(event, data)
+        finally:
+            stats.running -= 1
+            stats.handled += 1
+            self.limiter.release()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        user: Optional[User] = data.get("event_from_user")
+        priority = classify_update(event, user)
+        self.in_flight += 1
+        try:
+            if user is None:
+                return await self._run(priority, handler, event, data)
+            return await self._run_for_user(user.id, priority, handler, event, data)
+        finally:
+            self.in_flight -= 1
+
+    async def _run_for_user(self, user_id: int, priority: int, handler, event, data):
+        lock = self._user_locks.setdefault(user_id, asyncio.Lock())
+        self._user_pending[user_id] = self._user_pending.get(user_id, 0) + 1
+        try:
+            async with lock:
+                return await self._run(priority, handler, event, data)
+        finally:
+            self._user_pending[user_id] -= 1
+            if not self._user_pending[user_id]:
+                del self._user_pending[user_id]
+                del self._user_locks[user_id]
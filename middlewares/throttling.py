@@ -0,0 +1,131 @@
+"""Per-user anti-flood middleware.
+
+Double taps on a button and repeated /start presses arrive as identical
+updates a fraction of a second apart; each would run the full handler with
+its Mongo reads. While an identical callback or command of the same user is
+still being handled, or was handled less than ``THROTTLE_DUPLICATE_WINDOW``
+seconds ago, the copy is dropped (callbacks are answered so the button stops
+spinning). Users sending more than ``THROTTLE_RATE_LIMIT`` updates per
+``THROTTLE_RATE_PERIOD`` seconds get one friendly notice and their extra
+updates are shed. Admins are never throttled: they scan at the gate.
+"""
+
+import time
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, User
+from loguru import logger
+
+from config.bot_config import config
+
+throttle_stats: Counter = Counter()
+
+_NOTICE = {
+    "ru": "Слишком много запросов, подождите пару секунд 🙏",
+    "en": "Too many requests, please wait a couple of seconds 🙏",
+}
+
+_CLEANUP_EVERY = 1000
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(
+        self,
+        duplicate_window: Optional[float] = None,
+        rate_limit: Optional[int] = None,
+        rate_period: Optional[float] = None,
+    ):
+        self.duplicate_window = config.THROTTLE_DUPLICATE_WINDOW if duplicate_window is None else duplicate_window
+        self.rate_limit = config.THROTTLE_RATE_LIMIT if rate_limit is None else rate_limit
+        self.rate_period = config.THROTTLE_RATE_PERIOD if rate_period is None else rate_period
+        self._in_flight: Set[Tuple[int, str]] = set()
+        self._finished: Dict[Tuple[int, str], float] = {}
+        self._hits: Dict[int, Deque[float]] = {}
+        self._noticed: Dict[int, float] = {}
+        self._events = 0
+
+    @staticmethod
+    def _fingerprint(update: Update) -> Optional[str]:
+        if update.callback_query is not None:
+            return f"cb:{update.callback_query.data}"
+        message = update.message
+        if message is not None and message.text and message.text.startswith("/"):
+            return f"cmd:{message.text}"
+        return None
+
+    def _is_duplicate(self, key: Tuple[int, str], now: float) -> bool:
+        if key in self._in_flight:
+            return True
+        finished = self._finished.get(key)
+        return finished is not None and now - finished < self.duplicate_window
+
+    def _is_flooding(self, user_id: int, now: float) -> bool:
+        hits = self._hits.setdefault(user_id, deque())
+        while hits and now - hits[0] > self.rate_period:
+            hits.popleft()
+        if len(hits) >= self.rate_limit:
+            return True
+        hits.append(now)
+        return False
+
+    def _cleanup(self, now: float):
+        horizon = max(self.duplicate_window, self.rate_period)
+        self._finished = {key: at for key, at in self._finished.items() if now - at < self.duplicate_window}
+        self._hits = {user_id: hits for user_id, hits in self._hits.items() if hits and now - hits[-1] < horizon}
+        self._noticed = {user_id: at for user_id, at in self._noticed.items() if now - at < horizon}
+
+    async def _notify(self, update: Update, user: User, now: float):
+        if now - self._noticed.get(user.id, 0) < self.rate_period:
+            return
+        self._noticed[user.id] = now
+        text = _NOTICE["ru" if user.language_code == "ru" else "en"]
+        try:
+            if update.callback_query is not None:
+                await update.callback_query.answer(text)
+            elif update.message is not None:
+                await update.message.answer(text)
+        except Exception as exc:
+            logger.warning("throttling notice to {} failed: {!r}", user.id, exc)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        if not isinstance(event, Update) or user is None or user.id in config.admins:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        self._events += 1
+        if self._events % _CLEANUP_EVERY == 0:
+            self._cleanup(now)
+
+        fingerprint = self._fingerprint(event)
+        key = (user.id, fingerprint) if fingerprint else None
+        if key is not None and self._is_duplicate(key, now):
+            throttle_stats["duplicates"] += 1
+            if event.callback_query is not None:
+                try:
+                    await event.callback_query.answer()
+                except Exception as exc:
+                    logger.warning("answering duplicate callback of {} failed: {!r}", user.id, exc)
+            return None
+
+        if self._is_flooding(user.id, now):
+            throttle_stats["rate_limited"] += 1
+            await self._notify(event, user, now)
+            return None
+
+        throttle_stats["passed"] += 1
+        if key is None:
+            return await handler(event, data)
+        self._in_flight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
+            self._finished[key] = time.monotonic()
@@ -0,0 +1,40 @@
+"""Per-update log context.
+
+Registered as the outermost middleware: every record logged while an update is
+handled carries its ``update_id`` (``logger.contextualize``), and one record
+per update reports its type, user and ``duration_ms``, including updates that
+the throttling middleware drops.
+"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from loguru import logger
+
+
+class UpdateLoggingMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        user = data.get("event_from_user")
+        started = time.perf_counter()
+        status = "error"
+        with logger.contextualize(update_id=event.update_id):
+            try:
+                result = await handler(event, data)
+                status = "ok"
+                return result
+            finally:
+                logger.bind(
+                    update_type=event.event_type,
+                    user_id=user.id if user else None,
+                    duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                    status=status,
+                ).info("update {} handled", event.update_id)
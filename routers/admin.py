@@ -1,9 +1,11 @@
 import os
 from datetime import datetime
+from functools import partial
 
 import asyncio
-from aiogram import Router, F
+from aiogram import Dispatcher, Router, F
 from aiogram.filters import CommandStart, Command, CommandObject
+from aiogram.fsm.storage.redis import RedisStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, FSInputFile
@@ -12,19 +14,35 @@ from loguru import logger
 
 from config.bot_config import config
 from database.database import (
-    update_user_data,
-    get_user_data,
     delete_user_data,
-    add_log,
+    queue_log,
+    register_start,
+    get_counters,
+    rebuild_counters,
+    cancel_job,
+    list_jobs,
+    count_unreachable,
     export_utm_to_csv,
     export_tickets_to_csv,
-    get_user_ids,
+    count_segment,
     add_admin_id,
+    archive_past_seasons,
 )
+from database.connection import mongo_stats, ping_mongo
+from database.redis_storage import KEY_KINDS, redis_key_report, sweep_redis_keys
+from middlewares.scheduler import SchedulerMiddleware
+from middlewares.throttling import throttle_stats
+from services.broadcast import SENT, deliver
+from services.jobs import broadcast_key, reminder_key, schedule_broadcast, schedule_reminder
+from services.photo_scan import photo_ladder
+from services.profiling import format_summary, reset_baseline, start_tracing, take_memory_profile
+from services.telegram_api import api_stats_report
 from routers import main_dialog
 
 router = Router()
 
+_background_tasks = set()
+
 
 @router.message(CommandStart())
 async def command_start_handler(
@@ -35,11 +53,10 @@ async def command_start_handler(
 ) -> None:
     logger.info("Entering: command_start_handler")
     user_id = message.from_user.id
-    user_data = await get_user_data(user_id)
 
     # Capture start command arguments
     start_args = command.args
-    utm_data = {}
+    utm_data = None
 
     # Parse UTM parameters
     if start_args:
@@ -48,26 +65,20 @@ async def command_start_handler(
             if param.startswith('utm_'):
                 utm_data = param
 
-    # Update user data
-    update_data = {}
-    if not user_data or not user_data.get("StartDate"):
-        update_data["StartDate"] = datetime.utcnow()
-
-    update_data["Lang"] = message.from_user.language_code
-
-    # Add UTM data if present
+    # One upsert: StartDate on first visit, language, UTM tag, reachability
+    await register_start(user_id, message.from_user.language_code, utm_data)
     if utm_data:
-        update_data["utm"] = utm_data
-        await add_log("utm", {"user_id": user_id, "utm_data": utm_data})
-
-    # Update database
-    await update_user_data(user_id, update_data)
+        queue_log("utm", {"user_id": user_id, "utm_data": utm_data})
 
     # Update state
     await state.update_data(lang=message.from_user.language_code)
 
-    # Start dialog
-    await dialog_manager.start(main_dialog.MainStates.start, mode=StartMode.RESET_STACK)
+    # Start dialog; the windows take the language from start_data instead of reading the FSM
+    await dialog_manager.start(
+        main_dialog.MainStates.start,
+        mode=StartMode.RESET_STACK,
+        data={"lang": message.from_user.language_code},
+    )
     logger.info("Exiting: command_start_handler")
 
 
@@ -82,7 +93,7 @@ async def cmd_change_lang(
     lang = 'en' if data.get('lang') == 'ru' else 'ru'
     await message.answer(f"Язык изменен на {lang}")
     await state.update_data(lang=lang)
-    await dialog_manager.start(main_dialog.MainStates.start, mode=StartMode.RESET_STACK)
+    await dialog_manager.start(main_dialog.MainStates.start, mode=StartMode.RESET_STACK, data={"lang": lang})
     logger.info("Exiting: cmd_change_lang")
 
 
@@ -102,46 +113,183 @@ async def cmd_delete_data(
     logger.info("Exiting: cmd_delete_data")
 
 
+_EXPORT_MODES = ("full", "delta", "compact")
+
+
+async def _send_export(message: Message, command: CommandObject, export):
+    mode = (command.args or "full").strip().lower()
+    if mode not in _EXPORT_MODES:
+        await message.reply(f"Usage: /{command.command} [{'|'.join(_EXPORT_MODES)}]")
+        return
+    result = await export(mode)
+    caption = f"{result['rows']} rows, {result['new']} new" + (", compacted" if result['compacted'] else "")
+    if result['rows'] and os.path.isfile(result['path']):
+        await message.reply_document(FSInputFile(result['path']), caption=caption)
+    else:
+        await message.reply(f"Nothing to export ({caption})")
+
+
 @router.message(Command("export_utm"), F.chat.id.in_((-1002167206567, 84131737)))
-async def cmd_export_utm(message: Message, state: FSMContext):
+async def cmd_export_utm(message: Message, state: FSMContext, command: CommandObject):
     logger.info("Entering: cmd_export_utm")
-    await export_utm_to_csv()
-    filename = 'data/output.csv'
-    if os.path.isfile(filename):
-        await message.reply_document(FSInputFile(filename))
+    await _send_export(message, command, export_utm_to_csv)
     logger.info("Exiting: cmd_export_utm")
 
 
 @router.message(Command("export_tickets"), F.chat.id.in_((-1002167206567, 84131737)))
-async def cmd_export_tickets(message: Message, state: FSMContext):
+async def cmd_export_tickets(message: Message, state: FSMContext, command: CommandObject):
     logger.info("Entering: cmd_export_tickets")
-    await export_tickets_to_csv()
-    filename = 'data/output.csv'
-    if os.path.isfile(filename):
-        await message.reply_document(FSInputFile(filename))
+    await _send_export(message, command, export_tickets_to_csv)
     logger.info("Exiting: cmd_export_tickets")
 
 
+@router.message(Command("archive_seasons"), F.chat.id.in_((-1002167206567, 84131737)))
+async def cmd_archive_seasons(message: Message, state: FSMContext):
+    logger.info("Entering: cmd_archive_seasons")
+    await message.reply("Archiving past seasons...")
+    result = await archive_past_seasons()
+    await message.reply(
+        f"Archived {result['seasons']} season entries from {result['users']} users "
+        f"(legacy fields removed from {result['legacy']})."
+    )
+    logger.info("Exiting: cmd_archive_seasons")
+
+
+def _format_ms(value):
+    return f"{value:.1f} ms" if value is not None else "n/a"
+
+
+@router.message(Command("stats"), F.chat.id.in_((-1002167206567, 84131737)))
+async def cmd_stats(message: Message, state: FSMContext, update_scheduler: SchedulerMiddleware):
+    logger.info("Entering: cmd_stats")
+    await ping_mongo()
+    mongo = mongo_stats()
+    scans = photo_ladder.stats()
+    lines = [
+        "<b>Mongo</b>",
+        f"pool: {mongo['in_use']}/{mongo['max_pool_size']} in use "
+        f"({mongo['saturation']:.0%}, peak {mongo['peak_saturation']:.0%}), "
+        f"{mongo['connections']} open",
+        f"waiting: {mongo['waiting']} (peak {mongo['peak_waiting']}), "
+        f"checkout failures: {mongo['checkout_failures']}",
+        f"ping: {_format_ms(mongo['last_ping_ms'])} (avg {_format_ms(mongo['avg_ping_ms'])})",
+        "<b>Throttling</b>",
+        f"passed: {throttle_stats['passed']}, duplicates dropped: {throttle_stats['duplicates']}, "
+        f"rate limited: {throttle_stats['rate_limited']}",
+        "<b>Unreachable users</b>",
+        ", ".join(f"{reason}: {count}" for reason, count in (await count_unreachable()).items()) or "none",
+        "<b>Gate scans</b>",
+        f"{scans['scans']} photos, {scans['failed']} undecoded, start side {scans['start_side']}px, "
+        f"{scans['avg_kb']:.0f} KB downloaded per scan",
+        "downloads by side: " + (", ".join(f"{side}: {count}" for side, count in scans['downloads'].items()) or "none"),
+        "decoded by side: " + (", ".join(f"{side}: {count}" for side, count in scans['decoded'].items()) or "none"),
+        f"<b>Scheduler</b> ({update_scheduler.limiter.active}/{update_scheduler.limiter.limit} slots busy, "
+        f"{update_scheduler.limiter.waiting} queued)",
+    ]
+    for name, entry in update_scheduler.stats().items():
+        lines.append(f"{name}: queued {entry['waiting']}, running {entry['running']}, handled {entry['handled']}, "
+                     f"wait avg {entry['avg_wait_ms']:.1f} ms / max {entry['max_wait_ms']:.1f} ms")
+    lines.append("<b>Telegram API</b>")
+    for name, entry in list(api_stats_report().items())[:10]:
+        lines.append(f"{name}: {entry['calls']} calls, avg {entry['avg_ms']:.1f} ms / max {entry['max_ms']:.1f} ms, "
+                     f"{entry['retries']} retries, {entry['errors']} errors")
+    await message.reply("\n".join(lines))
+    logger.info("Exiting: cmd_stats")
+
+
+@router.message(Command("redis_report"), F.chat.id.in_((-1002167206567, 84131737)))
+async def cmd_redis_report(message: Message, state: FSMContext):
+    logger.info("Entering: cmd_redis_report")
+    if not isinstance(state.storage, RedisStorage):
+        await message.reply("FSM storage is not Redis")
+        logger.info("Exiting: cmd_redis_report (not redis)")
+        return
+    report = await redis_key_report(state.storage.redis)
+    lines = ["<b>Redis keys by kind</b>"]
+    for kind in KEY_KINDS:
+        if kind in report:
+            entry = report[kind]
+            lines.append(f"{kind}: {entry['keys']} keys, {entry['bytes'] / 1024:.1f} KiB, "
+                         f"{entry['no_ttl']} without TTL")
+    await message.reply("\n".join(lines))
+    logger.info("Exiting: cmd_redis_report")
+
+
+@router.message(Command("redis_sweep"), F.chat.id.in_((-1002167206567, 84131737)))
+async def cmd_redis_sweep(message: Message, state: FSMContext):
+    logger.info("Entering: cmd_redis_sweep")
+    if not isinstance(state.storage, RedisStorage):
+        await message.reply("FSM storage is not Redis")
+        logger.info("Exiting: cmd_redis_sweep (not redis)")
+        return
+    updated = await sweep_redis_keys(state.storage.redis)
+    details = ", ".join(f"{kind}: {count}" for kind, count in updated.items()) or "nothing to do"
+    await message.reply(f"TTL applied to keys without expiry ({details})")
+    logger.info("Exiting: cmd_redis_sweep")
+
+
+@router.message(Command("memprofile"), F.chat.id.in_((-1002167206567, 84131737)))
+async def cmd_memprofile(message: Message, command: CommandObject):
+    logger.info("Entering: cmd_memprofile")
+    if (command.args or "").strip().lower() == "reset":
+        if not start_tracing():
+            reset_baseline()
+        await message.reply("Memory baseline reset")
+        logger.info("Exiting: cmd_memprofile (reset)")
+        return
+    result = await take_memory_profile()
+    summary = format_summary(result)
+    if result["path"]:
+        await message.reply_document(FSInputFile(result["path"]), caption=summary)
+    else:
+        await message.reply(summary)
+    logger.info("Exiting: cmd_memprofile")
+
+
 class ExitState(StatesGroup):
     need_exit = State()
 
 
 @router.message(Command(commands=["exit"]))
 @router.message(Command(commands=["restart"]))
-async def cmd_exit(message: Message, state: FSMContext):
+async def cmd_exit(message: Message, state: FSMContext, dispatcher: Dispatcher):
     logger.info("Entering: cmd_exit")
     my_state = await state.get_state()
     if message.from_user.username == "itolstov":
         if my_state == ExitState.need_exit:
             await state.set_state(None)
             await message.reply("Chao :[[[")
-            exit()
+            # stop_polling waits for the shutdown hooks, which wait for this handler: don't await it.
+            # Running handlers are drained in on_shutdown, then systemd starts the bot again.
+            _background_tasks.add(asyncio.create_task(dispatcher.stop_polling()))
         else:
             await state.set_state(ExitState.need_exit)
             await message.reply(": '['")
     logger.info("Exiting: cmd_exit")
 
 
+def parse_segment(arg: str):
+    """Turn ``/send`` tokens such as ``en date_27_11 notscanned`` into ``segment_filter`` kwargs."""
+    segment = {"dates": []}
+    for raw_token in arg.split():
+        token = raw_token.lower()
+        if token == "all":
+            continue
+        if token in ("ru", "en"):
+            segment["lang"] = token
+        elif token.startswith("utm="):
+            segment["utm"] = raw_token[len("utm="):]  # tags are case-sensitive
+        elif token in ("ticket", "noticket"):
+            segment["has_ticket"] = token == "ticket"
+        elif token.startswith("date_"):
+            segment["dates"].append(token)
+        elif token in ("scanned", "notscanned"):
+            segment["scanned"] = token == "scanned"
+        else:
+            return None
+    return segment
+
+
 @router.message(Command("send"), F.chat.id.in_((-1002167206567, 84131737)))
 async def cmd_send(message: Message, state: FSMContext):
     logger.info("Entering: cmd_send")
@@ -162,28 +310,118 @@ async def cmd_send(message: Message, state: FSMContext):
 
     if arg.isdigit():
         # Send to specific user ID
-        try:
-            await message.reply_to_message.copy_to(chat_id=int(arg))
+        user_id = int(arg)
+        outcome = await deliver(user_id, partial(message.reply_to_message.copy_to, chat_id=user_id))
+        if outcome == SENT:
             await message.reply(f"Message sent to user ID: {arg}")
-        except Exception as e:
-            await message.reply(f"Error sending message: {str(e)}")
-    elif arg.lower() in ["all", "en", "ru"]:
-        # Send to all users
-        all_users = await get_user_ids(arg.lower())
-        success_count = 0
-        for user_id in all_users:
-            try:
-                await message.reply_to_message.copy_to(chat_id=user_id)
-                success_count += 1
-                await asyncio.sleep(0.3)
-            except Exception:
-                pass
-        await message.reply(f"Message sent to {success_count} out of {len(all_users)} users.")
+        else:
+            await message.reply(f"Error sending message to {arg}: {outcome}")
+        logger.info("Exiting: cmd_send")
+        return
+
+    segment = parse_segment(arg)
+    if segment is None:
+        await message.reply(
+            "Error: Invalid argument. Use a user ID or a segment: all | ru | en, utm=<tag>, "
+            "ticket | noticket, date_27_11 | date_28_11, scanned | notscanned."
+        )
+        logger.info("Exiting: cmd_send (invalid segment)")
+        return
+
+    total = await count_segment(**segment)
+    source = message.reply_to_message
+    # a long send runs as a job: in the handler it would hold this admin's updates, scans included
+    key = broadcast_key(source.chat.id, source.message_id)
+    if await schedule_broadcast(segment, source.chat.id, source.message_id, message.chat.id):
+        await message.reply(f"Sending to {total} users ({arg}) as {key}; /jobs shows the progress.")
     else:
-        await message.reply("Error: Invalid argument. Use a user ID or 'all'.")
+        await message.reply(f"{key} is already queued, /cancel_job {key} first")
     logger.info("Exiting: cmd_send")
 
 
+def _format_attendance(counters) -> str:
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    cap = config.REGISTRATION_CAP
+    lines = [
+        f"<b>Season {config.CURRENT_TICKET_SEASON}</b>",
+        f"registered: {counters.get('registered', 0)}" + (f" / {cap}" if cap else ""),
+        "planned: " + ", ".join(f"{date_id} {(counters.get('days') or {}).get(date_id, 0)}"
+                                for date_id in config.EVENT_DATES),
+        f"checked in today: {(counters.get('checked_in') or {}).get(today, 0)}, "
+        f"scans today: {(counters.get('scans') or {}).get(today, 0)}",
+        f"attended at least once: {counters.get('attended', 0)}",
+    ]
+    return "\n".join(lines)
+
+
+@router.message(Command("attendance"), F.chat.id.in_((-1002167206567, 84131737)))
+async def cmd_attendance(message: Message, state: FSMContext):
+    logger.info("Entering: cmd_attendance")
+    await message.reply(_format_attendance(await get_counters()))
+    logger.info("Exiting: cmd_attendance")
+
+
+@router.message(Command("rebuild_counters"), F.chat.id.in_((-1002167206567, 84131737)))
+async def cmd_rebuild_counters(message: Message, state: FSMContext):
+    logger.info("Entering: cmd_rebuild_counters")
+    await message.reply(_format_attendance(await rebuild_counters()))
+    logger.info("Exiting: cmd_rebuild_counters")
+
+
+@router.message(Command("remind"), F.chat.id.in_((-1002167206567, 84131737)))
+async def cmd_remind(message: Message, state: FSMContext, command: CommandObject):
+    """/remind date_27_11 2025-11-26 18:00 — in reply to the reminder text, time in UTC."""
+    logger.info("Entering: cmd_remind")
+    parts = (command.args or "").split(maxsplit=1)
+    if not message.reply_to_message or len(parts) < 2 or not parts[0].startswith("date_"):
+        await message.reply("Usage: reply to a message with /remind date_27_11 YYYY-MM-DD HH:MM (UTC)")
+        logger.info("Exiting: cmd_remind (bad arguments)")
+        return
+    date_id = parts[0]
+    if date_id not in config.EVENT_DATES:
+        await message.reply(f"Error: unknown day {date_id}, use one of: {', '.join(config.EVENT_DATES)}")
+        logger.info("Exiting: cmd_remind (unknown day)")
+        return
+    try:
+        run_at = datetime.strptime(parts[1].strip(), "%Y-%m-%d %H:%M")
+    except ValueError:
+        await message.reply("Error: time must look like 2025-11-26 18:00 (UTC)")
+        logger.info("Exiting: cmd_remind (bad time)")
+        return
+
+    created = await schedule_reminder(date_id, run_at, message.chat.id, message.reply_to_message.message_id)
+    key = reminder_key(config.CURRENT_TICKET_SEASON, date_id)
+    if created:
+        await message.reply(f"Reminder {key} scheduled for {run_at:%Y-%m-%d %H:%M} UTC")
+    else:
+        await message.reply(f"Reminder {key} is already queued, /cancel_job {key} first")
+    logger.info("Exiting: cmd_remind")
+
+
+@router.message(Command("jobs"), F.chat.id.in_((-1002167206567, 84131737)))
+async def cmd_jobs(message: Message, state: FSMContext):
+    logger.info("Entering: cmd_jobs")
+    jobs = await list_jobs()
+    lines = []
+    for job in jobs:
+        stats = ", ".join(f"{outcome}: {count}" for outcome, count in (job.get("stats") or {}).items())
+        lines.append(f"{job['key']} — {job['status']}, run at {job['run_at']:%Y-%m-%d %H:%M} UTC"
+                     + (f" ({stats})" if stats else ""))
+    await message.reply("\n".join(lines) or "No jobs")
+    logger.info("Exiting: cmd_jobs")
+
+
+@router.message(Command("cancel_job"), F.chat.id.in_((-1002167206567, 84131737)))
+async def cmd_cancel_job(message: Message, state: FSMContext, command: CommandObject):
+    logger.info("Entering: cmd_cancel_job")
+    key = (command.args or "").strip()
+    if key and await cancel_job(key):
+        await message.reply(f"{key} cancelled")
+    else:
+        await message.reply(f"No pending or running job {key!r}")
+    logger.info("Exiting: cmd_cancel_job")
+
+
 @router.message(Command("add"), F.chat.id.in_((-1002167206567, 84131737)))
 async def cmd_add(message: Message, state: FSMContext):
     logger.info("Entering: cmd_add")
@@ -1,15 +1,8 @@
-import os
-from uuid import uuid4
-
-# Absolute path to the data directory
-DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
-if not os.path.exists(DATA_DIR):
-    os.makedirs(DATA_DIR)
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Optional
+from uuid import uuid4
 
 from aiogram.enums import ContentType
-from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import CallbackQuery, Message
 from aiogram_dialog import Window, Dialog, DialogManager
@@ -19,36 +12,32 @@ from aiogram_dialog.widgets.media import StaticMedia
 from aiogram_dialog.widgets.text import Format, Const
 from loguru import logger
 
-from config.bot_config import config
-from database.database import update_user_data, get_user_data, get_last_key, add_scan_log
-from database.qr_helpers import create_beautiful_code, decode_qr_code
-
-
-def _get_ticket_info(user_data: Dict[str, Any], season: str) -> Dict[str, Any]:
-    tickets = user_data.get("tickets") if user_data else None
-    if isinstance(tickets, dict):
-        return tickets.get(season, {}) or {}
-    return {}
-
-
-def _find_ticket_season(user_data: Dict[str, Any], ticket_uuid: str) -> Optional[str]:
-    tickets = user_data.get("tickets") if user_data else None
-    season = config.CURRENT_TICKET_SEASON
-    if isinstance(tickets, dict):
-        info = tickets.get(season)
-        if isinstance(info, dict) and info.get("uuid") == ticket_uuid:
-            return season
-    return None
+from config.bot_config import config, current_festival
+from database.database import (
+    update_user_data,
+    get_user_profile,
+    find_ticket_holder,
+    find_ticket_holder_by_key,
+    get_last_key,
+    add_scan_log,
+    reserve_registration,
+    release_registration,
+    commit_questionnaire,
+    record_ticket_scan,
+)
+from database.blob_store import image_store, ticket_image_name
+from database.qr_helpers import render_beautiful_code, run_image_task
+from database.records import parse_ticket_key
+from services.photo_scan import decode_photo
 
 
-def _ensure_ticket_qr(ticket_uuid: Optional[str], ticket_key: Optional[str]) -> Optional[str]:
+async def _ensure_ticket_qr(ticket_uuid: Optional[str], ticket_key: Optional[str]) -> Optional[str]:
     if not ticket_uuid or not ticket_key:
         return None
-    file_path = os.path.join(DATA_DIR, f"{ticket_uuid}.png")
-    if not os.path.exists(file_path):
-        logger.info("Regenerating QR code for ticket %s", ticket_uuid)
-        create_beautiful_code(file_path, ticket_uuid, "MTLFEST" + ticket_key)
-    return file_path
+    return await image_store.ensure(
+        ticket_image_name(ticket_uuid, ticket_key),
+        lambda: run_image_task(render_beautiful_code, ticket_uuid, "MTLFEST" + ticket_key),
+    )
 
 
 class MainStates(StatesGroup):
@@ -64,43 +53,22 @@ class MainStates(StatesGroup):
     ticket_scan = State()
 
 
-async def get_start_data(dialog_manager: DialogManager, state: FSMContext, **kwargs):
-    logger.info("Entering: get_start_data")
-    data = await state.get_data()
-    user_id = dialog_manager.event.from_user.id
-    current_state = dialog_manager.middleware_data['aiogd_context'].state
-    user_data = await get_user_data(user_id)
-
-    season = config.CURRENT_TICKET_SEASON
-    ticket_info = _get_ticket_info(user_data, season)
-    ticket_uuid = ticket_info.get("uuid")
-    ticket_key = ticket_info.get("key")
-    _ensure_ticket_qr(ticket_uuid, ticket_key)
-
-    dates_selected = ticket_info.get("dates", {}) if isinstance(ticket_info, dict) else {}
-    if current_state == MainStates.ticket_dates:
-        dialog_manager.dialog_data.update({
-            "date_27_11": dates_selected.get("date_27_11", False),
-            "date_28_11": dates_selected.get("date_28_11", False),
-        })
-
-    lang = data.get('lang', 'en')
-    if lang == 'ru':
-        return {
-            "welcome_text": "Добро пожаловать! Я бот-помощник фестиваля. Выберите действие:",
-            "donate_text": "Наше мероприятие возможно только благодаря вашим пожертвованиям. \n"
-                           "Пожалуйста, помогайте нам любым удобным способом: \n"
-                           "<b>EURMTL | USDM | MTL| SATSMTL | XLM </b>\n"
-                           "<code>GBJ4BPR6WESHII6TO4ZUQBB6NJD3NBTK5LISVNKXMPOMMYSLR5DOXMFD</code>\n"
-                           "<b>BTC</b>\n"
-                           "<code>bc1qkyevfyq052dfx3jtlelulz3t2gvkq9jtpsee5m</code>\n"
-                           "<b>ETH</b>\n"
-                           "<code>0x7fB2369504ab724A3E5fBBe55C87A0B708B8C672</code>\n"
-                           "<b>USDT (trc20)</b>\n"
-                           "<code>TBRsYzKKNxM6jjyD3d1Adva2TbgkiAMLux</code>\n"
-                           "<b>Monero</b>\n"
-                           "<code>43RMnD3EDcHHL39eJPRqqDYhU9cWdGKABA3fetY8FNZwUQ9PNPGoxbZNSEaYKHYzeJMq2BsLpzrbhWCF7aueH4Tn7kTV7Pw</code>\n\n",
-            "calendar_text": """🎉 Основная программа Monteliber.Zaedno Fest 2025
+TEXTS = {
+    "ru": {
+        "welcome_text": "Добро пожаловать! Я бот-помощник фестиваля. Выберите действие:",
+        "donate_text": "Наше мероприятие возможно только благодаря вашим пожертвованиям. \n"
+                       "Пожалуйста, помогайте нам любым удобным способом: \n"
+                       "<b>EURMTL | USDM | MTL| SATSMTL | XLM </b>\n"
+                       "<code>GBJ4BPR6WESHII6TO4ZUQBB6NJD3NBTK5LISVNKXMPOMMYSLR5DOXMFD</code>\n"
+                       "<b>BTC</b>\n"
+                       "<code>bc1qkyevfyq052dfx3jtlelulz3t2gvkq9jtpsee5m</code>\n"
+                       "<b>ETH</b>\n"
+                       "<code>0x7fB2369504ab724A3E5fBBe55C87A0B708B8C672</code>\n"
+                       "<b>USDT (trc20)</b>\n"
+                       "<code>TBRsYzKKNxM6jjyD3d1Adva2TbgkiAMLux</code>\n"
+                       "<b>Monero</b>\n"
+                       "<code>43RMnD3EDcHHL39eJPRqqDYhU9cWdGKABA3fetY8FNZwUQ9PNPGoxbZNSEaYKHYzeJMq2BsLpzrbhWCF7aueH4Tn7kTV7Pw</code>\n\n",
+        "calendar_text": """🎉 Основная программа Monteliber.Zaedno Fest 2025
 \n\n📅 27 ноября — открытие фестиваля
 \n\nПодгорица, Черногорияв отеле <a href="https://maps.app.goo.gl/hKYJWZfxodnRRNcn7?g_st=ipc">Kings Park Hotel</a>
 \nФестиваль ждёт вас с 12 часов. 
@@ -119,41 +87,37 @@ async def get_start_data(dialog_manager: DialogManager, state: FSMContext, **kwa
 \nНовости и анонсы
 \nпубликуются в Telegram-канале <a href="https://t.me/monteliberofestival">Montelibero Fest</a>, так же на <a href="https://mtlfest.me/2025/ru">сайте</a>.
 \nЖдём вас! 🤗""",
-            "support_text": "По всем вопросам фестиваля можно написать в @mtlfest_support_bot — волонтёры ответят как можно быстрее.",
-            "show_ticket_text": "Это твой бесплатный билет на Monteliber.Zaedno Fest 27–28 ноября 2025. Покажи QR на входе с телефона или распечатай его. Если планы изменились — дай знать команде поддержки.",
-            "donate_button": "Донатить",
-            "ticket_button": "Мой билет",
-            "calendar_button": "Расписание",
-            "support_button": "Поддержка",
-            "back_button": "Назад",
-            "ticket_start_text": "Я помогу зарегистрироваться на Monteliber.Zaedno Fest 2025. Нажми Start, чтобы начать.",
-            "start_button": "Start",
-            "ticket_country_text": "Нам нужно немного информации, чтобы подготовить площадку. В какой стране ты сейчас живёшь?",
-            "ticket_source_text": "Расскажи, откуда узнал о фестивале?",
-            "ticket_dates_text": "Выбери дни, когда планируешь прийти. Это поможет нам рассчитать нагрузку на площадку.",
-            "date_27_11": "27 ноября — открытие и воркшопы",
-            "date_28_11": "28 ноября — лекции и afterparty",
-            "continue_button": "Продолжить",
-            "TicketUUID": ticket_uuid,
-            "TicketKey": ticket_key,
-            "is_admin": user_id in config.admins
-        }
-    else:
-        return {
-            "welcome_text": "Welcome! I'm the Monteliber.Zaedno Fest assistant bot. Choose an option:",
-            "donate_text": "We run this festival thanks to your donations.\n"
-                           "Please support us in any of the available ways: \n"
-                           "<b>EURMTL | USDM | MTL | SATSMTL | XLM</b>\n"
-                           "<code>GBJ4BPR6WESHII6TO4ZUQBB6NJD3NBTK5LISVNKXMPOMMYSLR5DOXMFD</code>\n"
-                           "<b>BTC</b>\n"
-                           "<code>bc1qkyevfyq052dfx3jtlelulz3t2gvkq9jtpsee5m</code>\n"
-                           "<b>ETH</b>\n"
-                           "<code>0x7fB2369504ab724A3E5fBBe55C87A0B708B8C672</code>\n"
-                           "<b>USDT (trc20)</b>\n"
-                           "<code>TBRsYzKKNxM6jjyD3d1Adva2TbgkiAMLux</code>\n"
-                           "<b>Monero</b>\n"
-                           "<code>43RMnD3EDcHHL39eJPRqqDYhU9cWdGKABA3fetY8FNZwUQ9PNPGoxbZNSEaYKHYzeJMq2BsLpzrbhWCF7aueH4Tn7kTV7Pw</code>\n",
-            "calendar_text": """🎉 Main programme of Monteliber.Zaedno Fest 2025
+        "support_text": "По всем вопросам фестиваля можно написать в @mtlfest_support_bot — волонтёры ответят как можно быстрее.",
+        "show_ticket_text": "Это твой бесплатный билет на Monteliber.Zaedno Fest 27–28 ноября 2025. Покажи QR на входе с телефона или распечатай его. Если планы изменились — дай знать команде поддержки.",
+        "donate_button": "Донатить",
+        "ticket_button": "Мой билет",
+        "calendar_button": "Расписание",
+        "support_button": "Поддержка",
+        "back_button": "Назад",
+        "ticket_start_text": "Я помогу зарегистрироваться на Monteliber.Zaedno Fest 2025. Нажми Start, чтобы начать.",
+        "start_button": "Start",
+        "ticket_country_text": "Нам нужно немного информации, чтобы подготовить площадку. В какой стране ты сейчас живёшь?",
+        "ticket_source_text": "Расскажи, откуда узнал о фестивале?",
+        "ticket_dates_text": "Выбери дни, когда планируешь прийти. Это поможет нам рассчитать нагрузку на площадку.",
+        "date_27_11": "27 ноября — открытие и воркшопы",
+        "date_28_11": "28 ноября — лекции и afterparty",
+        "continue_button": "Продолжить",
+    },
+    "en": {
+        "welcome_text": "Welcome! I'm the Monteliber.Zaedno Fest assistant bot. Choose an option:",
+        "donate_text": "We run this festival thanks to your donations.\n"
+                       "Please support us in any of the available ways: \n"
+                       "<b>EURMTL | USDM | MTL | SATSMTL | XLM</b>\n"
+                       "<code>GBJ4BPR6WESHII6TO4ZUQBB6NJD3NBTK5LISVNKXMPOMMYSLR5DOXMFD</code>\n"
+                       "<b>BTC</b>\n"
+                       "<code>bc1qkyevfyq052dfx3jtlelulz3t2gvkq9jtpsee5m</code>\n"
+                       "<b>ETH</b>\n"
+                       "<code>0x7fB2369504ab724A3E5fBBe55C87A0B708B8C672</code>\n"
+                       "<b>USDT (trc20)</b>\n"
+                       "<code>TBRsYzKKNxM6jjyD3d1Adva2TbgkiAMLux</code>\n"
+                       "<b>Monero</b>\n"
+                       "<code>43RMnD3EDcHHL39eJPRqqDYhU9cWdGKABA3fetY8FNZwUQ9PNPGoxbZNSEaYKHYzeJMq2BsLpzrbhWCF7aueH4Tn7kTV7Pw</code>\n",
+        "calendar_text": """🎉 Main programme of Monteliber.Zaedno Fest 2025
 \n\n📅 27 November — Opening Day
 \n\nWelcome session, introductions and first lectures
 \nPodgorica, Montenegro at <a href="https://maps.app.goo.gl/hKYJWZfxodnRRNcn7?g_st=ipc">Kings Park Hotel</a>
@@ -172,54 +136,133 @@ async def get_start_data(dialog_manager: DialogManager, state: FSMContext, **kwa
 \nThe number of places is limited.
 \n📢 Stay tuned for updates:
 \nNews and announcements are published on the <a href="https://t.me/monteliberofestival">Montelibero Fest Telegram channel</a> and on the <a href="https://mtlfest.me/2025/en">website</a>. """
-                            "out via @mtlfest_support_bot. "
-                            "Our volunteers will get back to you as soon as possible.",
-            "support_text": "For any questions message @mtlfest_support_bot — volunteers will reply as soon as possible.",
-            "show_ticket_text": "This is your free ticket to the main event on October, 5. You will need to show it at the gates for entrance on your mobile or printed. If you would like to attend other days of the festival please go to the website mtlfest.me/en and book them separately. Thank you",
-            "donate_button": "Donate",
-            "ticket_button": "My Ticket",
-            "calendar_button": "Schedule",
-            "support_button": "Support",
-            "back_button": "Back",
-            "ticket_start_text": "I'm here to help you register for Monteliber.Zaedno Fest 2025. Press Start to begin.",
-            "start_button": "Start",
-            "ticket_country_text": "We'd love to know where you're based right now to plan better. Which country are you currently in?",
-            "ticket_source_text": "How did you hear about the festival?",
-            "ticket_dates_text": "Pick the days you plan to attend so we can manage venue capacity.",
-            "date_27_11": "27 November — Opening & workshops",
-            "date_28_11": "28 November — Lectures & afterparty",
-            "continue_button": "Continue",
-            "TicketUUID": ticket_uuid,
-            "TicketKey": ticket_key,
-            "is_admin": user_id in config.admins
-        }
-    logger.info("Exiting: get_start_data")
+                        "out via @mtlfest_support_bot. "
+                        "Our volunteers will get back to you as soon as possible.",
+        "support_text": "For any questions message @mtlfest_support_bot — volunteers will reply as soon as possible.",
+        "show_ticket_text": "This is your free ticket to the main event on October, 5. You will need to show it at the gates for entrance on your mobile or printed. If you would like to attend other days of the festival please go to the website mtlfest.me/en and book them separately. Thank you",
+        "donate_button": "Donate",
+        "ticket_button": "My Ticket",
+        "calendar_button": "Schedule",
+        "support_button": "Support",
+        "back_button": "Back",
+        "ticket_start_text": "I'm here to help you register for Monteliber.Zaedno Fest 2025. Press Start to begin.",
+        "start_button": "Start",
+        "ticket_country_text": "We'd love to know where you're based right now to plan better. Which country are you currently in?",
+        "ticket_source_text": "How did you hear about the festival?",
+        "ticket_dates_text": "Pick the days you plan to attend so we can manage venue capacity.",
+        "date_27_11": "27 November — Opening & workshops",
+        "date_28_11": "28 November — Lectures & afterparty",
+        "continue_button": "Continue",
+    },
+}
+
+
+def _lang(dialog_manager: DialogManager) -> str:
+    # set by /start and /change_lang when the dialog starts; kept in the dialog context
+    start_data = dialog_manager.start_data
+    if isinstance(start_data, dict) and start_data.get("lang") in TEXTS:
+        return start_data["lang"]
+    return "ru" if dialog_manager.event.from_user.language_code == "ru" else "en"
+
+
+async def get_static_data(dialog_manager: DialogManager, **kwargs):
+    """Texts of the current language and admin status. No database or disk access."""
+    lang = _lang(dialog_manager)
+    data = dict(TEXTS[lang])
+    data.update(current_festival.get().texts.get(lang, {}))
+    data["is_admin"] = dialog_manager.event.from_user.id in config.admins
+    return data
+
+
+async def get_ticket_data(dialog_manager: DialogManager, **kwargs):
+    logger.info("Entering: get_ticket_data")
+    data = await get_static_data(dialog_manager)
+    profile = await get_user_profile(dialog_manager.event.from_user.id)
+    ticket_uuid = profile.ticket_uuid if profile else None
+    ticket_key = profile.ticket_key if profile else None
+    data.update({
+        "TicketUUID": ticket_uuid,
+        "TicketKey": ticket_key,
+        "TicketImage": await _ensure_ticket_qr(ticket_uuid, ticket_key),
+    })
+    logger.info("Exiting: get_ticket_data")
+    return data
+
+
+# Questionnaire answers live in dialog_data until on_dates_confirmed writes them in one update.
+# A copy is kept in the FSM data (Redis) so an abandoned questionnaire resumes where it stopped.
+_ANSWER_FIELDS = ("country", "source")
+_DRAFT_KEY = "questionnaire_draft"
+
+
+async def _save_draft(manager: DialogManager):
+    keys = _ANSWER_FIELDS + config.EVENT_DATES
+    draft = {key: manager.dialog_data[key] for key in keys if key in manager.dialog_data}
+    await manager.middleware_data["state"].update_data({_DRAFT_KEY: draft})
+
+
+async def _resume_questionnaire(manager: DialogManager) -> bool:
+    """Restore an unfinished questionnaire and open its first unanswered step."""
+    draft = (await manager.middleware_data["state"].get_data()).get(_DRAFT_KEY)
+    # {} is a started questionnaire without answers yet; None means none is in progress
+    if draft is None:
+        return False
+    manager.dialog_data.update(draft)
+    if not draft:
+        await manager.switch_to(MainStates.ticket_start)
+    elif "country" not in draft:
+        await manager.switch_to(MainStates.ticket_country)
+    elif "source" not in draft:
+        await manager.switch_to(MainStates.ticket_source)
+    else:
+        await manager.switch_to(MainStates.ticket_dates)
+        for date_id in config.EVENT_DATES:
+            if draft.get(date_id):
+                await manager.find(date_id).set_checked(True)
+    return True
+
+
+_REGISTRATION_CLOSED = {
+    "ru": "Регистрация закрыта: все места заняты 😔",
+    "en": "Registration is closed: all places are taken 😔",
+}
 
 
 async def on_button_clicked(c: CallbackQuery, button: Button, manager: DialogManager):
     logger.info("Entering: on_button_clicked")
     if button.widget_id == "ticket_start":
         user_id = c.from_user.id
-        user_data = await get_user_data(user_id)
+        profile = await get_user_profile(user_id)
         season = config.CURRENT_TICKET_SEASON
-        ticket_info = _get_ticket_info(user_data or {}, season)
-        ticket_uuid = ticket_info.get("uuid")
-        if ticket_uuid:
+        if profile and profile.ticket_uuid:
+            if await _resume_questionnaire(manager):
+                logger.info("Exiting: on_button_clicked (questionnaire resumed)")
+                return
             await manager.switch_to(MainStates.ticket_confirmation)
             logger.info("Exiting: on_button_clicked (user has ticket)")
             return
         else:
-            async with config.lock:
-                ticket_uuid = uuid4().hex
-                ticket_key = await get_last_key()
-                created_at = datetime.utcnow()
-                await update_user_data(user_id, {
-                    f"tickets.{season}.uuid": ticket_uuid,
-                    f"tickets.{season}.key": ticket_key,
-                    f"tickets.{season}.created_at": created_at,
-                })
-            logger.info("Generated ticket %s for user %s", ticket_uuid, user_id)
-            _ensure_ticket_qr(ticket_uuid, ticket_key)
+            if not await reserve_registration(season, config.REGISTRATION_CAP):
+                await c.answer(_REGISTRATION_CLOSED["ru" if c.from_user.language_code == "ru" else "en"],
+                               show_alert=True)
+                logger.info("Exiting: on_button_clicked (registration cap reached)")
+                return
+            try:
+                async with config.lock:
+                    ticket_uuid = uuid4().hex
+                    ticket_key = await get_last_key()
+                    created_at = datetime.utcnow()
+                    await update_user_data(user_id, {
+                        f"tickets.{season}.uuid": ticket_uuid,
+                        f"tickets.{season}.key": ticket_key,
+                        f"tickets.{season}.created_at": created_at,
+                    })
+            except Exception:
+                await release_registration(season)
+                raise
+            logger.info("Generated ticket {} for user {}", ticket_uuid, user_id)
+            await _ensure_ticket_qr(ticket_uuid, ticket_key)
+            await _save_draft(manager)  # marks the questionnaire as started
             # questionnaire on
             await manager.switch_to(MainStates.ticket_start)
             # questionnaire off
@@ -244,14 +287,14 @@ window_start = Window(
     main_button_group,
     SwitchTo(Const("Scan QR"), id="scan_qr", state=MainStates.ticket_scan, when="is_admin"),
     state=MainStates.start,
-    getter=get_start_data,
+    getter=get_static_data,
     disable_web_page_preview=True,
 )
 window_donate = Window(
     Format("{donate_text}"),
     main_button_group,
     state=MainStates.donate,
-    getter=get_start_data,
+    getter=get_static_data,
     disable_web_page_preview=True,
 )
 
@@ -259,7 +302,7 @@ window_calendar = Window(
     Format("{calendar_text}"),
     main_button_group,
     state=MainStates.calendar,
-    getter=get_start_data,
+    getter=get_static_data,
     disable_web_page_preview=True,
 )
 
@@ -267,7 +310,7 @@ window_support = Window(
     Format("{support_text}"),
     main_button_group,
     state=MainStates.support,
-    getter=get_start_data,
+    getter=get_static_data,
     disable_web_page_preview=True,
 )
 
@@ -275,15 +318,14 @@ window_ticket_start = Window(
     Format("{ticket_start_text}"),
     Button(Format("{start_button}"), id="ticket_country", on_click=on_button_clicked),
     state=MainStates.ticket_start,
-    getter=get_start_data
+    getter=get_static_data
 )
 
 
 async def mh_process_country(message: Message, widget: MessageInput, dialog_manager: DialogManager) -> None:
     logger.info("Entering: mh_process_country")
-    user_id = message.from_user.id
-    season = config.CURRENT_TICKET_SEASON
-    await update_user_data(user_id, {f"tickets.{season}.questionnaire.country": message.text})
+    dialog_manager.dialog_data["country"] = message.text
+    await _save_draft(dialog_manager)
     await dialog_manager.switch_to(MainStates.ticket_source)
     logger.info("Exiting: mh_process_country")
 
@@ -295,15 +337,14 @@ window_ticket_country = Window(
         content_types=ContentType.TEXT,
     ),
     state=MainStates.ticket_country,
-    getter=get_start_data
+    getter=get_static_data
 )
 
 
 async def mh_process_source(message: Message, widget: MessageInput, dialog_manager: DialogManager) -> None:
     logger.info("Entering: mh_process_source")
-    user_id = message.from_user.id
-    season = config.CURRENT_TICKET_SEASON
-    await update_user_data(user_id, {f"tickets.{season}.questionnaire.source": message.text})
+    dialog_manager.dialog_data["source"] = message.text
+    await _save_draft(dialog_manager)
     await dialog_manager.switch_to(MainStates.ticket_dates)
     logger.info("Exiting: mh_process_source")
 
@@ -315,45 +356,54 @@ window_ticket_source = Window(
         content_types=ContentType.TEXT,
     ),
     state=MainStates.ticket_source,
-    getter=get_start_data
+    getter=get_static_data
 )
 
+async def _check_in(message: Message, profile) -> None:
+    """Record a scan of ``profile``'s ticket the same way for a QR photo and a typed key."""
+    user_id = profile.user_id
+    if profile.ticket:
+        await record_ticket_scan(user_id, profile.ticket.season)
+    await message.reply(f'Успешно ! Можете присылать новый код ! или выйти в главное меню /start ')
+    await add_scan_log(admin_id=message.from_user.id, user_id=user_id)
+
+
 async def mh_process_qr(message: Message, widget: MessageInput, dialog_manager: DialogManager) -> None:
     logger.info("Entering: mh_process_qr")
-    admin_id = message.from_user.id
     #await update_user_data(user_id, {"LastEnterDate": datetime.utcnow()})
-    logger.info(f'{message.from_user.id}')
+    logger.info("{}", message.from_user.id)
     if message.photo:
         await message.reply('is being recognized')
-        await message.bot.download(message.photo[-1], destination=os.path.join(DATA_DIR, f'{message.from_user.id}.jpg'))
-
-        qr_data = decode_qr_code(os.path.join(DATA_DIR, f'{message.from_user.id}.jpg'))
-        # decode(Image.open(f"qr/{message.from_user.id}.jpg"))
+        qr_data = await decode_photo(message.bot, message.photo)
         if qr_data:
             logger.info(qr_data)
 
-            user_data = await get_user_data(0, qr_data)
-            if user_data:
-                user_id = user_data.get("UserID")
-                season = _find_ticket_season(user_data, qr_data)
-                if season:
-                    await update_user_data(user_id, {f"tickets.{season}.last_scanned_at": datetime.utcnow()})
-                await message.reply(f'Успешно ! Можете присылать новый код ! или выйти в главное меню /start ')
-                await add_scan_log(admin_id=admin_id, user_id=user_id)
-
+            profile = await find_ticket_holder(qr_data)
+            if profile:
+                await _check_in(message, profile)
             else:
                 await message.reply('Bad QR code =( or user not found')
         else:
-            await message.reply('Bad QR code =(')
+            await message.reply('Bad QR code =( Введите номер билета, например MTLFEST011')
+    elif message.text:
+        # the QR did not decode (cracked or glaring screen): the admin types the printed code
+        ticket_key = parse_ticket_key(message.text)
+        profile = await find_ticket_holder_by_key(ticket_key) if ticket_key else None
+        if profile:
+            await _check_in(message, profile)
+        elif ticket_key:
+            await message.reply(f'Билет MTLFEST{ticket_key} не найден')
+        else:
+            await message.reply('Ожидается фото QR-кода или номер билета, например MTLFEST011')
     logger.info("Exiting: mh_process_qr")
 
 
 
 window_qr_scan = Window(
-    Const("Сканируйте QR-код"),
+    Const("Сканируйте QR-код или введите номер билета (MTLFEST011)"),
     MessageInput(
         func=mh_process_qr,
-        content_types=ContentType.PHOTO,
+        content_types=[ContentType.PHOTO, ContentType.TEXT],
     ),
     state=MainStates.ticket_scan,
     #getter=get_start_data
@@ -363,6 +413,7 @@ window_qr_scan = Window(
 async def on_date_selected(c: CallbackQuery, checkbox: ManagedCheckbox, manager: DialogManager):
     logger.info("Entering: on_date_selected")
     manager.dialog_data[checkbox.widget_id] = checkbox.is_checked()
+    await _save_draft(manager)
     logger.info("Exiting: on_date_selected")
 
 
@@ -370,12 +421,10 @@ async def on_dates_confirmed(c: CallbackQuery, button: Button, manager: DialogMa
     logger.info("Entering: on_dates_confirmed")
     user_id = c.from_user.id
     season = config.CURRENT_TICKET_SEASON
-    async with config.lock:
-        data = {
-            f"tickets.{season}.dates.date_27_11": manager.dialog_data.get("date_27_11", False),
-            f"tickets.{season}.dates.date_28_11": manager.dialog_data.get("date_28_11", False),
-        }
-        await update_user_data(user_id, data)
+    answers = {field: manager.dialog_data[field] for field in _ANSWER_FIELDS if field in manager.dialog_data}
+    dates = {date_id: manager.dialog_data.get(date_id, False) for date_id in config.EVENT_DATES}
+    await commit_questionnaire(user_id, season, answers, dates)
+    await manager.middleware_data["state"].update_data({_DRAFT_KEY: None})
 
     await manager.switch_to(MainStates.ticket_confirmation)
     logger.info("Exiting: on_dates_confirmed")
@@ -399,7 +448,7 @@ window_ticket_dates = Window(
     ),
     Button(Format("{continue_button}"), id="confirm_dates", on_click=on_dates_confirmed),
     state=MainStates.ticket_dates,
-    getter=get_start_data
+    getter=get_static_data
 )
 
 window_ticket_image = Window(
@@ -407,14 +456,14 @@ window_ticket_image = Window(
     #     path="path/to/your/image.jpg"
     # ),
     StaticMedia(
-        path=Format(os.path.join(DATA_DIR, '{TicketUUID}.png')),
+        path=Format('{TicketImage}'),
         type=ContentType.PHOTO,
-        when="TicketUUID"
+        when="TicketImage"
     ),
     Format("{show_ticket_text}"),
     Button(Format("{back_button}"), id="start", on_click=on_button_clicked),
     state=MainStates.ticket_confirmation,
-    getter=get_start_data
+    getter=get_ticket_data
 )
 
 dialog = Dialog(
@@ -0,0 +1,80 @@
+"""Message delivery with reachability tracking.
+
+Users who blocked the bot, deleted their account or never opened a chat with
+it fail every delivery the same way. ``deliver`` records such permanent
+failures on the user document (``Unreachable``) so broadcast segments skip
+them, and ``reprobe_unreachable`` periodically checks them again with a
+``typing`` chat action, clearing the mark for those who came back.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from loguru import logger
+
+from config.bot_config import config
+from database.database import clear_unreachable, iter_unreachable_user_ids, mark_unreachable
+
+SENT = "sent"
+FAILED = "failed"
+
+
+def unreachable_reason(exc: Exception) -> Optional[str]:
+    """Reason to mark the user unreachable for, or ``None`` if the error may be temporary."""
+    text = str(exc).lower()
+    if isinstance(exc, TelegramForbiddenError):
+        if "deactivated" in text:
+            return "deactivated"
+        return "blocked"
+    if isinstance(exc, TelegramBadRequest) and "chat not found" in text:
+        return "chat_not_found"
+    return None
+
+
+async def deliver(user_id: int, send: Callable[[], Awaitable]) -> str:
+    """Run ``send`` for ``user_id`` and return ``SENT``, ``FAILED`` or the unreachable reason.
+
+    Flood control is waited out by the session's ``RetryRequestMiddleware``; a
+    ``TelegramRetryAfter`` that still gets here counts as ``FAILED``.
+    """
+    try:
+        await send()
+        return SENT
+    except Exception as exc:
+        reason = unreachable_reason(exc)
+        if reason is None:
+            logger.warning("deliver to {} failed: {!r}", user_id, exc)
+            return FAILED
+        await mark_unreachable(user_id, reason)
+        return reason
+
+
+async def reprobe_unreachable(bot: Bot, limit: int = 1000) -> int:
+    """Probe users marked unreachable more than ``REACHABILITY_REPROBE_HOURS`` ago. Returns users restored."""
+    logger.info("Entering: reprobe_unreachable")
+    marked_before = datetime.utcnow() - timedelta(hours=config.REACHABILITY_REPROBE_HOURS)
+    restored = 0
+    async for user_id in iter_unreachable_user_ids(marked_before, limit=limit):
+        outcome = await deliver(user_id, lambda: bot.send_chat_action(chat_id=user_id, action="typing"))
+        if outcome == SENT:
+            await clear_unreachable(user_id)
+            restored += 1
+        elif outcome == FAILED:
+            continue
+        # still unreachable: deliver() refreshed the mark, so the user is probed again next period
+        await asyncio.sleep(0.05)
+    logger.info("Exiting: reprobe_unreachable (restored={})", restored)
+    return restored
+
+
+async def reprobe_loop(bot: Bot):
+    # probe first: a bot restarted more often than the period would otherwise never get to it
+    while True:
+        try:
+            await reprobe_unreachable(bot)
+        except Exception as exc:
+            logger.exception("reprobe_unreachable failed: {!r}", exc)
+        await asyncio.sleep(config.REACHABILITY_REPROBE_HOURS * 3600)
@@ -0,0 +1,124 @@
+"""Local health and readiness endpoint.
+
+``HealthMonitor`` probes the bot's dependencies every ``HEALTH_PROBE_INTERVAL``
+seconds — a query on ``users_collection``, a ``PING`` to the Redis FSM storage
+and ``bot.get_me`` — and measures event loop lag by how late a short sleep
+wakes up. A small aiohttp server on ``HEALTH_HOST:HEALTH_PORT`` serves the
+latest results:
+
+* ``GET /health`` — liveness, always 200 while the loop answers;
+* ``GET /ready`` — 200 when every probe succeeded recently and the loop lag is
+  below ``HEALTH_MAX_LOOP_LAG``, 503 otherwise (also while draining on shutdown).
+
+Both return the same JSON body with per-dependency latency in milliseconds.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import Bot
+from aiogram.fsm.storage.base import BaseStorage
+from aiohttp import web
+from loguru import logger
+
+from config.bot_config import config
+from database.database import probe_users_collection
+
+_LAG_INTERVAL = 0.5
+
+
+class HealthMonitor:
+    def __init__(self, bot: Bot, storage: BaseStorage, update_scheduler=None):
+        self.probes: Dict[str, Callable[[], Awaitable]] = {
+            "mongo": probe_users_collection,
+            "telegram": bot.get_me,
+        }
+        redis = getattr(storage, "redis", None)
+        if redis is not None:
+            self.probes["redis"] = redis.ping
+        self.update_scheduler = update_scheduler
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.loop_lag = 0.0
+        self.max_loop_lag = 0.0
+        self.draining = False
+        self._tasks = []
+        self._runner: Optional[web.AppRunner] = None
+
+    async def probe(self, name: str, call: Callable[[], Awaitable]):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(call(), config.HEALTH_PROBE_TIMEOUT)
+            error = None
+        except Exception as exc:
+            error = repr(exc)
+            logger.warning("health probe {} failed: {}", name, error)
+        self.results[name] = {
+            "ok": error is None,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "error": error,
+            "at": time.time(),
+        }
+
+    async def probe_all(self):
+        await asyncio.gather(*(self.probe(name, call) for name, call in self.probes.items()))
+
+    async def _probe_loop(self):
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(config.HEALTH_PROBE_INTERVAL)
+
+    async def _lag_loop(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(_LAG_INTERVAL)
+            self.loop_lag = max(0.0, time.perf_counter() - started - _LAG_INTERVAL)
+            self.max_loop_lag = max(self.max_loop_lag, self.loop_lag)
+
+    def is_ready(self) -> bool:
+        if self.draining or self.loop_lag > config.HEALTH_MAX_LOOP_LAG:
+            return False
+        stale_before = time.time() - 3 * config.HEALTH_PROBE_INTERVAL
+        return all(
+            name in self.results and self.results[name]["ok"] and self.results[name]["at"] >= stale_before
+            for name in self.probes
+        )
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "ready": self.is_ready(),
+            "draining": self.draining,
+            "loop_lag_ms": round(self.loop_lag * 1000, 1),
+            "max_loop_lag_ms": round(self.max_loop_lag * 1000, 1),
+            "in_flight": self.update_scheduler.in_flight if self.update_scheduler is not None else None,
+            "probes": self.results,
+        }
+
+    async def _health(self, request: web.Request) -> web.Response:
+        return web.json_response(self.report())
+
+    async def _ready(self, request: web.Request) -> web.Response:
+        report = self.report()
+        return web.json_response(report, status=200 if report["ready"] else 503)
+
+    async def start(self):
+        logger.info("Entering: HealthMonitor.start(port={})", config.HEALTH_PORT)
+        await self.probe_all()
+        self._tasks = [asyncio.create_task(self._probe_loop()), asyncio.create_task(self._lag_loop())]
+        if config.HEALTH_PORT:
+            app = web.Application()
+            app.router.add_get("/health", self._health)
+            app.router.add_get("/ready", self._ready)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, config.HEALTH_HOST, config.HEALTH_PORT).start()
+        logger.info("Exiting: HealthMonitor.start")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
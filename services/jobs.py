@@ -0,0 +1,158 @@
+"""Persistent scheduled jobs.
+
+Jobs live in the Mongo ``jobs`` collection, so a restart neither loses nor
+repeats them: ``JobRunner`` claims a due job with a lease, records every
+handled recipient as the job cursor and resumes from it if the lease of a
+crashed runner expires. Recipients are messaged one by one through
+``services.broadcast.deliver`` at ``JOB_SEND_INTERVAL`` so a reminder is
+spread over time instead of hitting Telegram's flood limit at once.
+
+Kinds:
+
+* ``reminder`` — a message copied to the ticket holders who selected a given
+  event day;
+* ``broadcast`` — a ``/send`` to a segment, run here instead of in the handler
+  so the admin's other updates (gate scans) are not held up behind it; the
+  outcome is reported back to the admin chat.
+"""
+
+import asyncio
+from collections import Counter
+from datetime import datetime
+from functools import partial
+from typing import Any, Dict, Optional
+
+from aiogram import Bot
+from loguru import logger
+
+from config.bot_config import config
+from database.database import (
+    advance_job,
+    claim_due_job,
+    finish_job,
+    get_job_status,
+    iter_segment_user_ids,
+    record_job_failure,
+    release_job,
+    schedule_job,
+)
+from services.broadcast import SENT, deliver
+
+
+def reminder_key(season: str, date_id: str) -> str:
+    return f"reminder:{season}:{date_id}"
+
+
+async def schedule_reminder(
+    date_id: str,
+    run_at: datetime,
+    from_chat_id: int,
+    message_id: int,
+    season: Optional[str] = None,
+) -> bool:
+    """Queue a copy of ``message_id`` to the holders of ``date_id``. Returns ``False`` if one is pending or running."""
+    season = season or config.CURRENT_TICKET_SEASON
+    return await schedule_job(
+        reminder_key(season, date_id),
+        "reminder",
+        run_at,
+        {"season": season, "date_id": date_id, "from_chat_id": from_chat_id, "message_id": message_id},
+    )
+
+
+def broadcast_key(from_chat_id: int, message_id: int) -> str:
+    return f"broadcast:{from_chat_id}:{message_id}"
+
+
+async def schedule_broadcast(segment: Dict[str, Any], from_chat_id: int, message_id: int, report_to: int) -> bool:
+    """Queue a copy of ``message_id`` to ``segment`` right away; ``report_to`` gets the outcome."""
+    segment = {"season": config.CURRENT_TICKET_SEASON, **segment}
+    return await schedule_job(
+        broadcast_key(from_chat_id, message_id),
+        "broadcast",
+        datetime.utcnow(),
+        {"segment": segment, "from_chat_id": from_chat_id, "message_id": message_id, "report_to": report_to},
+    )
+
+
+class JobRunner:
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.current: Optional[str] = None
+
+    async def run_forever(self):
+        while True:
+            try:
+                job = await claim_due_job(config.JOB_LEASE_SECONDS)
+                if job is None:
+                    await asyncio.sleep(config.JOB_POLL_INTERVAL)
+                    continue
+                await self.run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.exception("JobRunner: {!r}", exc)
+                await asyncio.sleep(config.JOB_POLL_INTERVAL)
+
+    async def run(self, job: Dict[str, Any]):
+        key = job["key"]
+        logger.info("Entering: JobRunner.run(key={}, cursor={})", key, job.get('cursor'))
+        self.current = key
+        try:
+            if job["kind"] == "reminder":
+                payload = job["payload"]
+                segment = {"has_ticket": True, "dates": [payload["date_id"]], "season": payload["season"]}
+                status = await self._run_copy(job, segment)
+            elif job["kind"] == "broadcast":
+                status = await self._run_broadcast(job)
+            else:
+                logger.error("JobRunner: unknown job kind {!r}", job['kind'])
+                status = "failed"
+            await finish_job(key, status)
+        except asyncio.CancelledError:
+            # shutdown: the cursor is saved, let the next start resume without waiting for the lease
+            await release_job(key)
+            raise
+        except Exception:
+            # the lease runs out and the job is retried from its cursor, up to JOB_MAX_FAILURES runs
+            if await record_job_failure(key) < config.JOB_MAX_FAILURES:
+                raise
+            logger.exception("JobRunner: {} failed {} times, giving up", key, config.JOB_MAX_FAILURES)
+            status = "failed"
+            await finish_job(key, status)
+        finally:
+            self.current = None
+        logger.info("Exiting: JobRunner.run(key={}, status={})", key, status)
+
+    async def _run_copy(
+        self, job: Dict[str, Any], segment: Dict[str, Any], outcomes: Optional[Counter] = None
+    ) -> str:
+        """Copy the job's message to ``segment`` from the job cursor on, counting into ``outcomes``."""
+        key, payload = job["key"], job["payload"]
+        send = partial(self.bot.copy_message, from_chat_id=payload["from_chat_id"], message_id=payload["message_id"])
+        handled = 0
+        async for user_id in iter_segment_user_ids(after_user_id=job.get("cursor") or 0, **segment):
+            outcome = await deliver(user_id, partial(send, chat_id=user_id))
+            await advance_job(key, user_id, outcome, config.JOB_LEASE_SECONDS)
+            if outcomes is not None:
+                outcomes[outcome] += 1
+            handled += 1
+            if handled % config.JOB_BATCH_SIZE == 0 and await get_job_status(key) == "cancelled":
+                return "cancelled"
+            await asyncio.sleep(config.JOB_SEND_INTERVAL)
+        return "done"
+
+    async def _run_broadcast(self, job: Dict[str, Any]) -> str:
+        payload = job["payload"]
+        # a resumed job continues the counts of the runs before it
+        outcomes = Counter(job.get("stats") or {})
+        status = await self._run_copy(job, payload["segment"], outcomes)
+        sent = outcomes.pop(SENT, 0)
+        details = ", ".join(f"{reason}: {count}" for reason, count in outcomes.items())
+        text = (f"{job['key']} {status}: message sent to {sent} out of {sent + sum(outcomes.values())} users."
+                + (f"\nNot delivered: {details}" if details else ""))
+        try:
+            await self.bot.send_message(payload["report_to"], text)
+        except Exception as exc:
+            logger.warning("JobRunner: report of {} not sent: {!r}", job["key"], exc)
+        return status
@@ -0,0 +1,91 @@
+"""Gate scans from the smallest photo size that decodes.
+
+Telegram offers every photo in several ``PhotoSize`` variants; the largest is
+often over 1 MB while a mid-size one usually decodes just as well.
+``decode_photo`` downloads the sizes into memory starting from
+``PhotoSizeLadder.start_side`` and moves to larger ones only when decoding
+fails. The ladder keeps the last ``SCAN_HISTORY`` outcomes per side and starts
+at the smallest side that decoded at least ``SCAN_SUCCESS_RATE`` of the time;
+every ``SCAN_PROBE_EVERY``-th scan starts one size lower to learn whether a
+smaller size would do.
+"""
+
+import io
+from collections import Counter, defaultdict, deque
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.types import PhotoSize
+from loguru import logger
+
+from config.bot_config import config
+from database.qr_helpers import decode_qr_bytes, run_image_task
+
+
+def _side(photo: PhotoSize) -> int:
+    return max(photo.width, photo.height)
+
+
+class PhotoSizeLadder:
+    def __init__(self):
+        # side -> recent decode outcomes of downloads at that side
+        self.outcomes: Dict[int, deque] = defaultdict(lambda: deque(maxlen=config.SCAN_HISTORY))
+        self.scans = 0
+        self.failed = 0
+        self.downloads: Counter = Counter()
+        self.decoded: Counter = Counter()
+        self.downloaded_bytes = 0
+
+    def start_side(self) -> int:
+        """Smallest side that recently decoded often enough, ``SCAN_START_SIDE`` until one did."""
+        reliable = [
+            side for side, outcomes in self.outcomes.items()
+            if len(outcomes) >= 5 and sum(outcomes) / len(outcomes) >= config.SCAN_SUCCESS_RATE
+        ]
+        return min(reliable, default=config.SCAN_START_SIDE)
+
+    def order(self, photos: List[PhotoSize]) -> List[PhotoSize]:
+        """Sizes to try for one scan, smallest first, beginning at the learned start."""
+        photos = sorted(photos, key=_side)
+        usable = [photo for photo in photos if _side(photo) >= config.SCAN_MIN_SIDE] or photos[-1:]
+        target = self.start_side()
+        first = next((index for index, photo in enumerate(usable) if _side(photo) >= target), len(usable) - 1)
+        self.scans += 1
+        if first > 0 and self.scans % config.SCAN_PROBE_EVERY == 0:
+            first -= 1
+        return usable[first:]
+
+    def record_attempt(self, photo: PhotoSize, size: int, decoded: bool):
+        side = _side(photo)
+        self.downloads[side] += 1
+        self.downloaded_bytes += size
+        self.outcomes[side].append(decoded)
+        if decoded:
+            self.decoded[side] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "scans": self.scans,
+            "failed": self.failed,
+            "start_side": self.start_side(),
+            "downloads": dict(sorted(self.downloads.items())),
+            "decoded": dict(sorted(self.decoded.items())),
+            "avg_kb": self.downloaded_bytes / 1024 / self.scans if self.scans else 0.0,
+        }
+
+
+photo_ladder = PhotoSizeLadder()
+
+
+async def decode_photo(bot: Bot, photos: List[PhotoSize]) -> Optional[str]:
+    """Decode the QR code of a photo message, downloading larger sizes only as needed."""
+    for photo in photo_ladder.order(photos):
+        buffer = await bot.download(photo, destination=io.BytesIO())
+        data = buffer.getvalue()
+        result = await run_image_task(decode_qr_bytes, data)
+        photo_ladder.record_attempt(photo, len(data), bool(result))
+        if result:
+            return result
+        logger.info("decode_photo: nothing at {}x{}, trying a larger size", photo.width, photo.height)
+    photo_ladder.failed += 1
+    return None
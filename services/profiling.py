@@ -0,0 +1,158 @@
+"""Memory profiling of the running bot.
+
+``take_memory_profile`` snapshots ``tracemalloc``, diffs it against the
+baseline taken when tracing started (or was last reset), counts live objects
+by type and reads the process RSS, and writes the report to
+``MEMPROFILE_DIR/memprofile-<timestamp>.txt``. It backs the ``/memprofile``
+admin command and ``memprofile_loop``, which runs it every
+``MEMPROFILE_INTERVAL_HOURS`` so growth over the festival days ends up on disk.
+
+Tracing costs memory and CPU on every allocation, so it starts only with
+``MEMPROFILE_TRACE`` set or on the first ``/memprofile``; that first call
+only records the baseline.
+"""
+
+import asyncio
+import gc
+import os
+import resource
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from config.bot_config import config
+
+_TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_baseline: Optional[tracemalloc.Snapshot] = None
+_baseline_at: Optional[datetime] = None
+_baseline_traced = 0
+
+
+def rss_bytes() -> int:
+    """Current resident set size; the peak from ``getrusage`` where ``/proc`` is missing."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+
+
+def reset_baseline():
+    global _baseline, _baseline_at, _baseline_traced
+    _baseline, _baseline_at = _snapshot(), datetime.utcnow()
+    _baseline_traced = tracemalloc.get_traced_memory()[0]
+
+
+def start_tracing() -> bool:
+    """Start ``tracemalloc`` and take the baseline. Returns ``False`` if it was already running."""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(config.MEMPROFILE_FRAMES)
+    reset_baseline()
+    logger.info("tracemalloc started ({} frames)", config.MEMPROFILE_FRAMES)
+    return True
+
+
+def object_counts(limit: int) -> List[tuple]:
+    counts = Counter(type(obj).__qualname__ for obj in gc.get_objects())
+    return counts.most_common(limit)
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def _build_report(limit: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    gc.collect()
+    snapshot = _snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    group_by = "traceback" if config.MEMPROFILE_FRAMES > 1 else "lineno"
+    growth = snapshot.compare_to(_baseline, group_by)[:limit]
+    top = snapshot.statistics(group_by)[:limit]
+    lines = [
+        f"Memory profile {datetime.utcnow():%Y-%m-%d %H:%M:%S} UTC",
+        f"RSS: {_format_size(rss_bytes())}",
+        f"Traced: {_format_size(current)} (peak {_format_size(peak)}), baseline {_baseline_at:%Y-%m-%d %H:%M:%S} UTC",
+        "",
+        f"Top {limit} growth since baseline:",
+    ]
+    for stat in growth:
+        lines.append(f"  {_format_size(stat.size_diff):>12} {stat.count_diff:+8d} blocks  {stat.traceback[-1]}")
+        # callers of the allocation site, most recent first
+        lines.extend(f"      <- {frame}" for frame in reversed(list(stat.traceback)[:-1]))
+    lines += ["", f"Top {limit} allocation sites:"]
+    for stat in top:
+        lines.append(f"  {_format_size(stat.size):>12} {stat.count:8d} blocks  {stat.traceback[-1]}")
+    lines += ["", f"Top {limit} object types:"]
+    lines.extend(f"  {count:10d}  {name}" for name, count in object_counts(limit))
+    lines += ["", f"Profile took {time.perf_counter() - started:.2f}s"]
+    return {
+        "text": "\n".join(lines),
+        "rss": rss_bytes(),
+        "traced": current,
+        "growth": current - _baseline_traced,
+    }
+
+
+def _write(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+
+
+async def take_memory_profile(limit: int = 25) -> Dict[str, Any]:
+    """Write a profile report to ``MEMPROFILE_DIR`` and return ``{path, rss, traced, growth, started}``.
+
+    ``started`` is ``True`` (and ``path`` is ``None``) when tracing had to be started by this
+    call: the next one reports growth against the baseline taken now.
+    """
+    logger.info("Entering: take_memory_profile")
+    if start_tracing():
+        logger.info("Exiting: take_memory_profile (tracing started)")
+        return {"path": None, "rss": rss_bytes(), "traced": 0, "growth": 0, "started": True}
+    # the snapshot and the gc walk hold the GIL anyway, so they run on the loop
+    report = _build_report(limit)
+    os.makedirs(config.MEMPROFILE_DIR, exist_ok=True)
+    path = os.path.join(config.MEMPROFILE_DIR, f"memprofile-{datetime.utcnow():%Y%m%d-%H%M%S}.txt")
+    await asyncio.to_thread(_write, path, report["text"])
+    logger.info("Exiting: take_memory_profile (rss={}, path={})", _format_size(report['rss']), path)
+    return {"path": path, "rss": report["rss"], "traced": report["traced"], "growth": report["growth"], "started": False}
+
+
+def format_summary(result: Dict[str, Any]) -> str:
+    if result["started"]:
+        return f"tracemalloc started, baseline taken (RSS {_format_size(result['rss'])}). Run again later to compare."
+    return (f"RSS {_format_size(result['rss'])}, traced {_format_size(result['traced'])}, "
+            f"{_format_size(result['growth'])} since baseline")
+
+
+async def memprofile_loop():
+    start_tracing()
+    while True:
+        await asyncio.sleep(config.MEMPROFILE_INTERVAL_HOURS * 3600)
+        try:
+            result = await take_memory_profile()
+            logger.info("memprofile: {}", format_summary(result))
+        except Exception as exc:
+            logger.exception("take_memory_profile failed: {!r}", exc)
@@ -0,0 +1,134 @@
+"""Bot API client session.
+
+``create_session`` builds the ``PooledAiohttpSession`` of the bot with a
+connection pool of ``API_POOL_LIMIT`` (``API_POOL_LIMIT_PER_HOST`` to
+api.telegram.org), keep-alive of ``API_KEEPALIVE_TIMEOUT`` seconds and a
+request timeout of ``API_TIMEOUT``, and installs ``RetryRequestMiddleware``:
+
+* flood control (429, ``TelegramRetryAfter``) is waited out and retried for
+  every method, as long as the wait is at most ``API_RETRY_MAX_WAIT`` seconds;
+  this is the only place that handles it, callers get the error once retries
+  are used up;
+* network errors and Telegram 5xx are retried with exponential backoff, but
+  only for methods that do not post anything: a send that timed out may have
+  been delivered, and retrying it would duplicate the message.
+
+Every request is timed per API method into ``api_stats`` for ``/stats``.
+"""
+
+import asyncio
+import ssl
+import time
+from collections import defaultdict
+from typing import Any, Dict
+
+import certifi
+from aiogram import Bot, __version__
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiohttp import ClientSession, TCPConnector
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from loguru import logger
+
+from config.bot_config import config
+
+_POSTING_PREFIXES = ("send", "copy", "forward")
+
+
+class _MethodStats:
+    __slots__ = ("calls", "errors", "retries", "total", "max")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": self.total / self.calls * 1000 if self.calls else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+api_stats: Dict[str, _MethodStats] = defaultdict(_MethodStats)
+
+
+def api_stats_report() -> Dict[str, Dict[str, Any]]:
+    """Per-method stats, most called first."""
+    ordered = sorted(api_stats.items(), key=lambda item: item[1].calls, reverse=True)
+    return {name: entry.as_dict() for name, entry in ordered}
+
+
+class RetryRequestMiddleware(BaseRequestMiddleware):
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        stats = api_stats[name]
+        attempt = 1
+        while True:
+            started = time.perf_counter()
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as exc:
+                if attempt >= config.API_RETRY_ATTEMPTS or exc.retry_after > config.API_RETRY_MAX_WAIT:
+                    stats.errors += 1
+                    raise
+                delay, reason = exc.retry_after, "flood control"
+            except (TelegramNetworkError, TelegramServerError) as exc:
+                if attempt >= config.API_RETRY_ATTEMPTS or name.startswith(_POSTING_PREFIXES):
+                    stats.errors += 1
+                    raise
+                delay, reason = config.API_RETRY_BACKOFF * 2 ** (attempt - 1), repr(exc)
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                stats.calls += 1
+                stats.total += elapsed
+                stats.max = max(stats.max, elapsed)
+            stats.retries += 1
+            logger.warning("{}: {}, retry {} in {:.1f}s", name, reason, attempt, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class PooledAiohttpSession(AiohttpSession):
+    """``AiohttpSession`` whose connector also sets the per-host limit and the keep-alive.
+
+    ``AiohttpSession`` only takes the total ``limit``; proxies are not supported here.
+    """
+
+    async def create_session(self) -> ClientSession:
+        if self._session is None or self._session.closed:
+            connector = TCPConnector(
+                ssl=ssl.create_default_context(cafile=certifi.where()),
+                limit=config.API_POOL_LIMIT,
+                limit_per_host=config.API_POOL_LIMIT_PER_HOST,
+                keepalive_timeout=config.API_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=3600,  # as AiohttpSession does
+            )
+            self._session = ClientSession(
+                connector=connector,
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{__version__}"},
+            )
+        return self._session
+
+
+def create_session(**kwargs: Any) -> AiohttpSession:
+    session = PooledAiohttpSession(timeout=config.API_TIMEOUT, **kwargs)
+    session.middleware(RetryRequestMiddleware())
+    return session